@@ -0,0 +1,297 @@
+# 启动命令示例：python fml_server_dashboard_bench.py --nodes 2000 --interval 10 --duration 60 --http_clients 16
+# 功能：在本机回环地址上启动master子进程，模拟大量slave节点通过UDP上报，同时用并发HTTP客户端访问仪表盘，
+#      输出接收吞吐量、丢包率、页面延迟(p50/p99)和每个节点的内存占用，用于扩容前评估和发现性能回退
+
+# ---------- 导入必要的系统库 ----------
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import fml_server_dashboard_slave as slave
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------- 解析命令行参数 ----------
+def parse_args():
+    parser = argparse.ArgumentParser(description="服务器监控主节点压力测试")
+    parser.add_argument("--nodes", type=int, default=1000, help="模拟的slave节点数")
+    parser.add_argument("--gpus", type=int, default=8, help="每个节点的GPU数")
+    parser.add_argument("--mounts", type=int, default=4, help="每个节点的挂载点数")
+    parser.add_argument("--users", type=int, default=5, help="每个节点上报的用户数")
+    parser.add_argument("--interval", type=float, default=10, help="每个节点的上报间隔秒数(整体速率 = 节点数 / 间隔)")
+    parser.add_argument("--duration", type=float, default=30, help="测量时长秒数(不含预热)")
+    parser.add_argument("--wire", choices=["json", "bin"], default="bin", help="上报格式")
+    parser.add_argument("--compress", action="store_true", help="bin 格式下使用 zlib 压缩")
+    parser.add_argument("--senders", type=int, default=2, help="发送上报的进程数")
+    parser.add_argument("--http_clients", type=int, default=8, help="并发HTTP客户端数，0 表示不测试页面")
+    parser.add_argument("--http_paths", type=str, default="/,/api/nodes", help="HTTP客户端轮流请求的路径，逗号分隔")
+    parser.add_argument("--data_port", type=int, default=19901, help="master 的 UDP 端口")
+    parser.add_argument("--web_port", type=int, default=19900, help="master 的 HTTP 端口")
+    parser.add_argument("--master_args", type=str, default="", help="传给master的其他参数，如 \"--udp_workers 4\"")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子，相同参数和种子生成相同的上报内容")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果，便于对比不同版本")
+    return parser.parse_args()
+
+
+# ---------- 生成一个节点的模拟数值指标，结构与slave的 collect_metrics 相同 ----------
+def make_metrics(rng, index, args):
+    cores = 64
+    cpu_cores = [slave.window_stats([rng.uniform(0, 100) for _ in range(4)]) for _ in range(cores)]
+    percent = round(sum(core["avg"] for core in cpu_cores) / cores, 2)
+    total_mem = 512.0
+    return {
+        "name": f"bench-{index:05d}",
+        "ip": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+        "ts": 0,
+        "cpu": {"percent": percent, "min": 0.0, "max": 100.0, "p95": 95.0, "cores": cpu_cores, "temp": round(rng.uniform(35, 80), 1), "count": cores},
+        "memory": {"total": total_mem, "used": round(rng.uniform(10, total_mem), 2), "swap_total": 8.0, "swap_used": round(rng.uniform(0, 1), 2)},
+        "disks": [{"mount": "/" if i == 0 else f"/data{i}", "total": 7450, "used": rng.randint(100, 7000)} for i in range(args.mounts)],
+        "gpus": [
+            {"index": i, "util": float(rng.randint(0, 100)), "mem_used": float(rng.randint(0, 81920)), "mem_total": 81920.0, "fan": float(rng.randint(30, 90)), "power": round(rng.uniform(60, 400), 2)}
+            for i in range(args.gpus)
+        ],
+        "users": [
+            {"user": f"user{rng.randint(0, 200)}", "cpu": round(rng.uniform(0, 32), 2), "rss": round(rng.uniform(0, 200), 2), "gpu_mem": float(rng.randint(0, 81920)), "procs": rng.randint(1, 50), "since": int(time.time()) - rng.randint(60, 86400)}
+            for _ in range(args.users)
+        ],
+        "timings": {"ip": 0.0001, "cpu": 0.0002, "memory": 0.0005, "disks": 0.001, "gpus": 0.002, "users": 0.01},
+    }
+
+
+# ---------- 编码一次上报，返回UDP数据报列表 ----------
+def encode(metrics, args):
+    if args.wire == "bin":
+        return slave.pack_datagrams(slave.encode_report(metrics), args.compress, 1400)
+    return [json.dumps(slave.build_json_info(metrics), ensure_ascii=False).encode("utf-8")]
+
+
+# ---------- 发送进程：负责一部分节点，按固定速率轮流上报 ----------
+def sender_main(args, indexes, start_at, stop_at, result_queue):
+    """
+    每个节点每 interval 秒上报一次，各节点的上报时间均匀错开
+    上报时间戳每次递增101秒，避免被master按100秒窗口去重(master用接收时间记录历史，不受影响)
+    """
+    rng = random.Random(args.seed * 1000003 + indexes[0])
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    target = ("127.0.0.1", args.data_port)
+    # 每个节点预生成两份不同的指标，轮流发送以模拟数值变化
+    variants = [(make_metrics(rng, i, args), make_metrics(rng, i, args)) for i in indexes]
+    base_ts = int(time.time())
+    reports = datagrams = errors = 0
+    per_second = len(indexes) / args.interval
+    sent_at_start = None
+    count = 0
+    while True:
+        now = time.time()
+        if now >= stop_at:
+            break
+        # 落后于时间表时连续发送，超前时休眠
+        due = len(indexes) + max(0, int((now - start_at) * per_second))  # 开始前先让每个节点上报一次(预热)
+        if count >= due:
+            time.sleep(min(0.005, max(0, stop_at - now)))
+            continue
+        if sent_at_start is None and now >= start_at:
+            sent_at_start = (reports, datagrams)
+        slot = count % len(indexes)
+        metrics = dict(variants[slot][(count // len(indexes)) % 2], ts=base_ts + 101 * (count // len(indexes)))
+        for datagram in encode(metrics, args):
+            try:
+                sock.sendto(datagram, target)
+                datagrams += 1
+            except OSError:
+                errors += 1
+        reports += 1
+        count += 1
+    if sent_at_start is None:
+        sent_at_start = (reports, datagrams)
+    result_queue.put({"reports": reports - sent_at_start[0], "datagrams": datagrams - sent_at_start[1], "total_reports": reports, "total_datagrams": datagrams, "errors": errors})
+
+
+# ---------- HTTP客户端线程：保持连接，循环请求并记录每个请求的延迟 ----------
+def http_client(args, paths, stop_at, latencies, errors):
+    conn = None
+    i = 0
+    while time.time() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", args.web_port, timeout=10)
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            response.read()
+            latencies[path].append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            conn = None
+
+
+# ---------- 工具函数 ----------
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * q) - 1)]
+
+
+def fetch_json(args, path):
+    conn = http.client.HTTPConnection("127.0.0.1", args.web_port, timeout=10)
+    conn.request("GET", path)
+    return json.loads(conn.getresponse().read())
+
+
+def fetch_metrics(args):
+    """读取master的 /metrics，返回 {指标行名: 数值}"""
+    conn = http.client.HTTPConnection("127.0.0.1", args.web_port, timeout=10)
+    conn.request("GET", "/metrics")
+    values = {}
+    for line in conn.getresponse().read().decode("utf-8").splitlines():
+        if line and not line.startswith("#"):
+            key, _, value = line.rpartition(" ")
+            values[key] = float(value)
+    return values
+
+
+def wait_drained(args, timeout=60):
+    """等待master处理完socket缓冲区中积压的数据包(接收计数连续1秒不变)，返回最终的接收统计"""
+    deadline = time.time() + timeout
+    stats = fetch_json(args, "/api/stats")
+    while time.time() < deadline:
+        time.sleep(1)
+        latest = fetch_json(args, "/api/stats")
+        if latest["received"] == stats["received"]:
+            return latest
+        stats = latest
+    return stats
+
+
+def read_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def wait_ready(args, proc, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"master 启动失败，退出码 {proc.returncode}")
+        try:
+            fetch_json(args, "/api/stats")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("等待 master 启动超时")
+
+
+# ---------- 主程序入口 ----------
+def main():
+    args = parse_args()
+    paths = [p for p in args.http_paths.split(",") if p]
+
+    # 启动master子进程(输出丢弃，避免日志影响测量)
+    command = [sys.executable, os.path.join(HERE, "fml_server_dashboard_master.py"), "--data_port", str(args.data_port), "--web_port", str(args.web_port)]
+    command += args.master_args.split()
+    master = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(args, master)
+        rss_before = read_rss_mb(master.pid)
+
+        # 预热：每个节点先上报一次，等待master处理完毕，再开始按速率发送
+        warmup = max(2.0, args.nodes / 5000)
+        start_at = time.time() + warmup
+        stop_at = start_at + args.duration
+        result_queue = multiprocessing.Queue()
+        chunks = [list(range(i, args.nodes, args.senders)) for i in range(args.senders)]
+        senders = [multiprocessing.Process(target=sender_main, args=(args, chunk, start_at, stop_at, result_queue), daemon=True) for chunk in chunks if chunk]
+        for p in senders:
+            p.start()
+
+        time.sleep(max(0, start_at - time.time()))
+        stats_start = fetch_json(args, "/api/stats")
+        metrics_start = fetch_metrics(args)
+        rss_loaded = read_rss_mb(master.pid)
+
+        # 测量期间并发访问仪表盘
+        latencies = {path: [] for path in paths}
+        http_errors = []
+        clients = [threading.Thread(target=http_client, args=(args, paths, stop_at, latencies, http_errors), daemon=True) for _ in range(args.http_clients)]
+        for t in clients:
+            t.start()
+        results = [result_queue.get(timeout=args.duration + warmup + 600) for _ in senders]
+        for t in clients:
+            t.join()
+        for p in senders:
+            p.join()
+        stats_end = wait_drained(args)
+        metrics_end = fetch_metrics(args)
+        rss_end = read_rss_mb(master.pid)
+    finally:
+        master.terminate()
+        master.wait()
+
+    # 汇总结果：发送总数与master的接收计数对比得到丢包率，测量窗口内的写入数得到吞吐量
+    sent_datagrams = sum(r["total_datagrams"] for r in results)
+    sent_reports = sum(r["total_reports"] for r in results)
+    window_reports = sum(r["reports"] for r in results)
+    stored = stats_end["stored"] - stats_start["stored"]
+
+    def render_mean(page):
+        key_sum = f'fml_render_seconds_sum{{page="{page}"}}'
+        key_count = f'fml_render_seconds_count{{page="{page}"}}'
+        count = metrics_end.get(key_count, 0) - metrics_start.get(key_count, 0)
+        return (metrics_end.get(key_sum, 0) - metrics_start.get(key_sum, 0)) / count if count else None
+
+    result = {
+        "params": {k: getattr(args, k) for k in ("nodes", "gpus", "mounts", "users", "interval", "duration", "wire", "compress", "senders", "http_clients", "master_args", "seed")},
+        "offered_reports_per_sec": round(window_reports / args.duration, 1),
+        "ingest_reports_per_sec": round(stored / args.duration, 1),
+        "sent_reports": sent_reports,
+        "sent_datagrams": sent_datagrams,
+        "received_datagrams": stats_end["received"],
+        "loss_rate": round(1 - stats_end["received"] / sent_datagrams, 6) if sent_datagrams else None,
+        "socket_drops": stats_end["socket_drops"],
+        "dropped_error": stats_end["dropped_error"],
+        "nodes_stored": stats_end["nodes"],
+        "rss_mb": {"idle": rss_before, "loaded": rss_loaded, "end": rss_end},
+        "memory_per_node_kb": round((rss_end - rss_before) * 1024 / max(1, stats_end["nodes"]), 1) if rss_end and rss_before else None,
+        "http": {
+            path: {
+                "requests": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 2) if values else None,
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+            }
+            for path, values in latencies.items()
+        },
+        "http_errors": len(http_errors),
+        "render_mean_ms": {page: round(v * 1000, 2) if v is not None else None for page, v in (("html", render_mean("html")), ("nodes", render_mean("nodes")))},
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"参数: {result['params']}")
+    print(f"发送速率: {result['offered_reports_per_sec']} 次上报/秒，master写入速率: {result['ingest_reports_per_sec']} 次上报/秒")
+    print(f"数据报: 发送 {sent_datagrams}，master收到 {stats_end['received']}，丢包率 {result['loss_rate']:.4%} (内核缓冲区溢出 {stats_end['socket_drops']})")
+    print(f"节点数: {stats_end['nodes']}，内存: 空闲 {rss_before:.1f}MB -> 结束 {rss_end:.1f}MB，每个节点约 {result['memory_per_node_kb']}KB")
+    for path, item in result["http"].items():
+        print(f"HTTP {path}: {item['requests']} 次请求，p50 {item['p50_ms']}ms，p99 {item['p99_ms']}ms")
+    print(f"HTTP 错误: {len(http_errors)}，master端平均渲染耗时: {result['render_mean_ms']}")
+
+
+if __name__ == "__main__":
+    main()
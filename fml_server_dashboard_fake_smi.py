@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# 启动命令示例：python fml_server_dashboard_slave.py --name test --master 127.0.0.1:9901 --gpu_sampler --nvidia_smi ./fml_server_dashboard_fake_smi.py
+# 功能：模拟 nvidia-smi 的 --query-gpu / --query-compute-apps 输出，用于在没有GPU的机器上测试slave的GPU采集
+# 通过环境变量控制: FAKE_SMI_GPUS GPU数量(默认4), FAKE_SMI_GLITCH 每隔多少轮把最后一块GPU的输出换成一行错误信息(默认0不出错),
+# FAKE_SMI_HANG 启动后先卡住的秒数(模拟卡死的驱动)
+
+# ---------- 导入必要的系统库 ----------
+import os
+import sys
+import time
+import random
+
+
+def main():
+    gpus = int(os.environ.get("FAKE_SMI_GPUS", "4"))
+    glitch = int(os.environ.get("FAKE_SMI_GLITCH", "0"))
+    time.sleep(float(os.environ.get("FAKE_SMI_HANG", "0")))
+    args = sys.argv[1:]
+
+    # 进程显存占用查询：没有计算进程
+    if any(arg.startswith("--query-compute-apps") for arg in args):
+        return
+
+    # 持续采样模式: -lms <毫秒>，否则只输出一轮
+    interval = None
+    if "-lms" in args:
+        interval = int(args[args.index("-lms") + 1]) / 1000
+    round_no = 0
+    while True:
+        round_no += 1
+        lines = []
+        for i in range(gpus):
+            if glitch and round_no % glitch == 0 and i == gpus - 1:
+                lines.append(f"Unable to determine the device handle for GPU{i}: Unknown Error")
+                continue
+            util = random.randint(0, 100)
+            lines.append(f"{i}, {util}, {random.randint(0, 24000)}, 24576, [N/A], {random.uniform(50, 300):.2f}")
+        print("\n".join(lines), flush=True)
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    main()
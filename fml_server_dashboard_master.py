@@ -1,5 +1,5 @@
 # 启动命令示例：python fml_server_dashboard_master.py --data_port 9901 --web_port 9900
-# 功能：接收slave节点发送的JSON格式系统信息，并通过HTTP服务提供Web仪表盘展示
+# 功能：接收slave节点发送的系统信息(JSON或紧凑二进制格式)，并通过HTTP服务提供Web仪表盘展示
 
 # ---------- 导入必要的网络、线程、时间等系统库 ----------
 import socket
@@ -7,10 +7,26 @@ import argparse
 import threading
 import time
 import http.server
-import socketserver
 import json
+import re
+import gzip
+import html
+import math
+import struct
+import zlib
+import os
+import mmap
+import heapq
+import selectors
+import random
+import bisect
+import queue
+import subprocess
 
-from datetime import datetime, timedelta
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
 
 # ---------- 解析命令行参数 ----------
@@ -19,14 +35,628 @@ def parse_args():
     parser.add_argument("--data_port", type=int, required=True, help="接收数据的 UDP 端口")
     parser.add_argument("--web_port", type=int, required=True, help="网页服务的 HTTP 端口")
     parser.add_argument("--white_list", type=str, default="", help="白名单，格式: name1,ip1;name2,ip2 允许为空")
+    parser.add_argument("--udp_workers", type=int, default=1, help="UDP 接收线程数，支持 SO_REUSEPORT 时每个线程独占一个 socket")
+    parser.add_argument("--udp_rcvbuf", type=int, default=4 * 1024 * 1024, help="UDP socket 接收缓冲区字节数(受系统 net.core.rmem_max 限制)")
+    parser.add_argument("--udp_batch", type=int, default=64, help="每次加锁批量处理的最大数据包数")
+    parser.add_argument("--data_dir", type=str, default="", help="持久化目录(为空则不持久化)，保存追加日志和快照，重启后自动恢复")
+    parser.add_argument("--segment_mb", type=int, default=64, help="持久化日志段大小(MB)")
+    parser.add_argument("--snapshot_interval", type=float, default=600, help="生成快照的间隔秒数，快照之前的日志段会被删除")
+    parser.add_argument("--relay_to", type=str, default="", help="中继模式: 上级master的 host:port，定期将收到的节点数据批量压缩后转发")
+    parser.add_argument("--relay_interval", type=float, default=5, help="中继转发间隔秒数")
+    parser.add_argument("--relay_mtu", type=int, default=1400, help="中继转发的单个UDP数据报最大字节数")
+    parser.add_argument("--stale_after", type=float, default=360, help="节点超过该秒数未上报时在页面上灰色显示")
+    parser.add_argument("--expire_after", type=float, default=7200, help="节点超过该秒数未上报时删除")
+    parser.add_argument("--alert_rules", type=str, default="", help="告警规则配置文件(JSON)，为空则不启用告警")
+    parser.add_argument("--http_workers", type=int, default=32, help="处理 HTTP 连接的线程池大小")
+    parser.add_argument("--http_max_conns", type=int, default=256, help="同时保持的 HTTP 连接数上限(含排队)，超出直接关闭")
+    parser.add_argument("--http_timeout", type=float, default=15, help="HTTP 请求读写超时秒数")
+    parser.add_argument("--http_idle_timeout", type=float, default=3, help="HTTP 连接等待下一个请求的空闲超时秒数，超时后关闭连接释放线程")
+    parser.add_argument("--sse_max_clients", type=int, default=1000, help="实时推送(/events)订阅连接数上限")
+    parser.add_argument("--sse_buffer_kb", type=int, default=256, help="每个订阅连接的发送缓冲区上限(KB)，超出的慢客户端会被断开")
     return parser.parse_args()
 
 
+# ---------- 自监控：固定分桶的耗时直方图，与接收计数器一起以Prometheus文本格式从 /metrics 输出 ----------
+# 分桶边界固定，记录一次只需二分查找和一次短暂加锁，可以放在每个数据包的处理路径上
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 每个分桶的计数(非累计)，最后一个为 +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        prefix = labels + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total:.6f}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+
+histograms = {}  # 指标名 -> [说明, {标签字符串: Histogram}]
+
+
+def histogram(name, help_text, **labels):
+    """注册(或取得已注册的)直方图，在模块加载时创建，热路径上直接使用返回的对象"""
+    series = histograms.setdefault(name, [help_text, {}])[1]
+    key = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return series.setdefault(key, Histogram())
+
+
+PARSE_SECONDS = {kind: histogram("fml_ingest_parse_seconds", "单个数据报的解码耗时(含JSON解析、分片重组、生成显示信息)", format=kind) for kind in ("binary", "json", "bundle")}
+INGEST_BATCH_SECONDS = histogram("fml_ingest_batch_seconds", "一批数据报写入注册表、日志和历史数据的耗时")
+LOCK_HOLD_SECONDS = {op: histogram("fml_registry_lock_hold_seconds", "读取或清理时持有节点数据锁的时间", op=op) for op in ("snapshot", "changes", "sweep", "free_gpus")}
+RENDER_SECONDS = {key: histogram("fml_render_seconds", "缓存失效后重新渲染的耗时", page=key) for key in ("html", "nodes")}
+HTTP_ROUTES = ("/", "/api/nodes", "/api/history", "/api/users", "/api/free_gpus", "/api/alerts", "/api/stats", "/events", "/metrics")
+HTTP_SECONDS = {route: histogram("fml_http_request_seconds", "HTTP请求处理耗时(/events 只含建立订阅)", route=route) for route in HTTP_ROUTES}
+CLEANUP_SECONDS = histogram("fml_cleanup_seconds", "一次离线/过期清理的耗时")
+SNAPSHOT_SECONDS = histogram("fml_snapshot_seconds", "生成一次持久化快照的耗时")
+BROADCAST_SECONDS = histogram("fml_sse_broadcast_seconds", "实时推送一批事件的序列化和发送耗时")
+# slave在上报中携带各采集函数的耗时，按采集项汇总全部节点(只接受固定的采集项名，避免标签数量失控)
+SLAVE_COLLECTORS = ("ip", "cpu", "memory", "disks", "gpus", "users")
+SLAVE_SECONDS = {key: histogram("fml_slave_collector_seconds", "slave各采集函数的耗时(由slave上报)", collector=key) for key in SLAVE_COLLECTORS}
+
+
+def observe_slave_timings(timings):
+    if not isinstance(timings, dict):
+        return
+    for key, seconds in timings.items():
+        hist = SLAVE_SECONDS.get(key)
+        if hist is not None and isinstance(seconds, (int, float)) and seconds >= 0:
+            hist.observe(seconds)
+
+
+# ---------- 节点记录：紧凑的 __slots__ 对象，更新时整体替换不原地修改，读取方拿到引用后无需加锁 ----------
+class NodeRecord:
+    __slots__ = ("info", "metrics", "version", "received", "ts", "seen", "stale")
+
+    def __init__(self, info, metrics, version, received, ts, seen, stale=False):
+        self.info = info  # 显示信息
+        self.metrics = metrics  # 类型化数值指标
+        self.version = version  # 最后变化时的数据版本号
+        self.received = received  # master接收时间(epoch秒)，用于展示和持久化
+        self.ts = ts  # slave上报时间(epoch秒)，仅用于旧版上报去重
+        self.seen = seen  # master接收时间(monotonic)，用于判断离线和过期，不受slave时钟偏差和系统时间调整影响
+        self.stale = stale  # 超过离线阈值未上报，页面上灰色显示
+
+
+# ---------- 节点注册表：节点数据、数据版本号和过期索引 ----------
+# 离线/过期按master的monotonic接收时间判断，用两个最小堆索引，清理时只弹出到期的条目，不扫描全部节点
+# 节点数据、增量上报会话状态分别加锁，且只在O(1)/O(log n)的短操作中持有，渲染和序列化都在锁外完成
+class NodeRegistry:
+    REMOVED_KEEP = 4096  # 最多保留的删除记录数
+
+    def __init__(self, stale_after=360, expire_after=7200):
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self.lock = threading.Lock()
+        self.records = {}  # 节点名 -> NodeRecord
+        self.version = 0  # 数据版本号，每次写入、标记离线或删除节点时递增(需持有self.lock)
+        self.removed = {}  # 已删除节点名 -> 删除时的版本号，按版本号顺序插入，用于增量查询
+        self.removed_floor = 0  # 早于该版本的删除记录已被清理，增量查询需返回全量
+        # 每个在线节点在 stale_heap 中恰有一个条目 (入堆时的接收时间, 节点名)，再次上报时不更新堆，到期弹出时再按最新接收时间重新入堆
+        self.stale_heap = []
+        self.expire_heap = []  # 已离线节点 (接收时间, 节点名)，弹出时与记录不一致的条目直接丢弃
+        self.seq_lock = threading.Lock()
+        self.sessions = {}  # 节点名 -> [会话ID, 最后序号, 合并后的原始数值指标]，用于增量上报(需持有self.seq_lock)
+        self.resync_requested = {}  # 节点名 -> 上次请求重同步的时间(monotonic)，限制请求频率
+        # 空闲GPU索引：在线节点的每块GPU一个条目 (-空闲显存MB, 利用率, 节点名, GPU编号, 显存总量MB)，按空闲显存降序、利用率升序排列
+        # 写入、离线、恢复和删除节点时随之更新，查询时二分定位显存下限，不扫描节点也不解析显示字符串
+        self.gpu_index = []
+        self.gpu_keys = {}  # 节点名 -> 该节点在 gpu_index 中的条目
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, name):
+        return self.records.get(name)
+
+    def snapshot(self):
+        """返回 (版本号, [(节点名, 记录), ...])"""
+        with self.lock:
+            started = time.perf_counter()
+            result = self.version, list(self.records.items())
+        LOCK_HOLD_SECONDS["snapshot"].observe(time.perf_counter() - started)
+        return result
+
+    def changes(self, since=None):
+        """返回 (版本号, 是否全量, since之后变化的[(节点名, 记录)], since之后删除的节点名)，since为None或无法增量时返回全量"""
+        with self.lock:
+            started = time.perf_counter()
+            version = self.version
+            # 增量查询的版本号过旧(删除记录已被清理)或来自未来(master已重启)时返回全量
+            full = since is None or since < self.removed_floor or since > version
+            if full:
+                changed, removed = list(self.records.items()), []
+            else:
+                changed = [(name, record) for name, record in self.records.items() if record.version > since]
+                removed = [name for name, removed_version in self.removed.items() if removed_version > since]
+        LOCK_HOLD_SECONDS["changes"].observe(time.perf_counter() - started)
+        return version, full, changed, removed
+
+    def store(self, name, info, metrics, received, ts, seen=None):
+        """写入节点的最新数据并递增版本号，返回新记录"""
+        if seen is None:
+            seen = time.monotonic()
+        with self.lock:
+            return self._store(name, info, metrics, received, ts, seen, self.records.get(name))
+
+    def store_many(self, items, received):
+        """批量写入中继转发的 [(节点名, 节点信息, 数值指标, 上报时间)]，只加一次锁，返回 [(节点名, 记录)]"""
+        seen = time.monotonic()
+        stored = []
+        with self.lock:
+            for name, info, metrics, ts in items:
+                # 单个条目出错(如指标类型异常)时跳过该条目，不影响同批其余节点；调用方按返回数量统计丢弃数
+                try:
+                    stored.append((name, self._store(name, info, metrics, received, ts, seen, self.records.get(name))))
+                except Exception as e:
+                    error_log.log(type(e).__name__, f"写入节点 {name} 失败: {e}")
+        return stored
+
+    def _store(self, name, info, metrics, received, ts, seen, old):
+        # 需持有self.lock；先计算GPU索引条目，出错时不修改任何状态
+        keys = self._gpu_keys(name, metrics)
+        self.version += 1
+        record = self.records[name] = NodeRecord(info, metrics, self.version, received, ts, seen)
+        if old is None or old.stale:
+            heapq.heappush(self.stale_heap, (seen, name))
+        self.removed.pop(name, None)
+        self._index_gpus(name, keys)
+        return record
+
+    @staticmethod
+    def _gpu_keys(name, metrics):
+        keys = []
+        for gpu in (metrics or {}).get("gpus") or ():
+            util, used, total = gpu.get("util"), gpu.get("mem_used"), gpu.get("mem_total")
+            # 缺少利用率或显存数据的GPU无法判断是否空闲，不进入索引
+            if util is None or used is None or total is None:
+                continue
+            keys.append((used - total, util, name, gpu.get("index"), total))
+        # 在修改索引前排序一次，键无法比较时在此抛出
+        keys.sort()
+        return keys
+
+    def _index_gpus(self, name, keys):
+        # 需持有self.lock；用_gpu_keys计算好的条目替换节点在空闲GPU索引中的条目，keys为空时只移除
+        index = self.gpu_index
+        for key in self.gpu_keys.pop(name, ()):
+            del index[bisect.bisect_left(index, key)]
+        for key in keys:
+            bisect.insort(index, key)
+        if keys:
+            self.gpu_keys[name] = keys
+
+    def free_gpus(self, min_free, max_util):
+        """返回空闲显存不少于min_free(MB)且利用率不超过max_util的 [(-空闲显存, 利用率, 节点名, GPU编号, 显存总量)]，按空闲显存降序"""
+        with self.lock:
+            started = time.perf_counter()
+            end = bisect.bisect_right(self.gpu_index, (-min_free, float("inf")))
+            candidates = self.gpu_index[:end]
+        LOCK_HOLD_SECONDS["free_gpus"].observe(time.perf_counter() - started)
+        return [key for key in candidates if key[1] <= max_util]
+
+    def touch(self, name, ts, received):
+        """心跳：只刷新存活时间和显示的上报时间，不递增版本号；离线节点恢复在线时递增版本号并返回新记录，否则返回None"""
+        revived = self.touch_many([(name, ts)], received)
+        return revived[0][1] if revived else None
+
+    def touch_many(self, items, received):
+        """批量处理 [(节点名, 上报时间)] 心跳，返回恢复在线的 [(节点名, 记录)]"""
+        seen = time.monotonic()
+        timestamps = {ts: {"display": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))} for _, ts in items}
+        revived = []
+        with self.lock:
+            for name, ts in items:
+                old = self.records.get(name)
+                if old is None:
+                    continue
+                version = old.version
+                if old.stale:
+                    self.version += 1
+                    version = self.version
+                    heapq.heappush(self.stale_heap, (seen, name))
+                    self._index_gpus(name, self._gpu_keys(name, old.metrics))
+                record = self.records[name] = NodeRecord(dict(old.info, timestamp=timestamps[ts]), old.metrics, version, received, ts, seen)
+                if old.stale:
+                    revived.append((name, record))
+        return revived
+
+    def bump(self):
+        """只递增版本号不修改节点，用于页面上节点之外的内容(告警)变化时使渲染缓存失效"""
+        with self.lock:
+            self.version += 1
+            return self.version
+
+    def remove(self, names):
+        """删除节点及其关联状态，返回删除时的版本号"""
+        with self.lock:
+            version = self._remove(names)
+        self._forget_sessions(names)
+        return version
+
+    def _remove(self, names):
+        # 需持有self.lock
+        self.version += 1
+        for name in names:
+            self.records.pop(name, None)
+            self.removed.pop(name, None)
+            self.removed[name] = self.version
+            self._index_gpus(name, ())
+        # 删除记录过多时清理最旧的部分，并提高增量查询的下限版本
+        while len(self.removed) > self.REMOVED_KEEP:
+            oldest = next(iter(self.removed))
+            self.removed_floor = max(self.removed_floor, self.removed.pop(oldest))
+        return self.version
+
+    def _forget_sessions(self, names):
+        with self.seq_lock:
+            for name in names:
+                self.sessions.pop(name, None)
+                self.resync_requested.pop(name, None)
+
+    def sweep(self, now=None):
+        """
+        弹出到期的堆条目：超过 stale_after 未上报的节点标记为离线，超过 expire_after 的离线节点删除
+        返回 (新离线的[(节点名, 记录)], 删除的节点名列表, 删除时的版本号)
+        """
+        now = time.monotonic() if now is None else now
+        stale = []
+        expired = []
+        version = None
+        with self.lock:
+            started = time.perf_counter()
+            heap = self.stale_heap
+            while heap and heap[0][0] <= now - self.stale_after:
+                seen, name = heapq.heappop(heap)
+                record = self.records.get(name)
+                if record is None or record.stale:
+                    continue
+                if record.seen != seen:
+                    # 入堆之后又有上报，按最新接收时间重新入堆
+                    heapq.heappush(heap, (record.seen, name))
+                    continue
+                self.version += 1
+                record = self.records[name] = NodeRecord(record.info, record.metrics, self.version, record.received, record.ts, seen, True)
+                heapq.heappush(self.expire_heap, (seen, name))
+                self._index_gpus(name, ())
+                stale.append((name, record))
+            heap = self.expire_heap
+            while heap and heap[0][0] <= now - self.expire_after:
+                seen, name = heapq.heappop(heap)
+                record = self.records.get(name)
+                if record is not None and record.stale and record.seen == seen:
+                    expired.append(name)
+            if expired:
+                version = self._remove(expired)
+        LOCK_HOLD_SECONDS["sweep"].observe(time.perf_counter() - started)
+        if expired:
+            self._forget_sessions(expired)
+            # 阈值配置为 expire_after <= stale_after 时，节点可能在同一次清理中被标记离线后立即删除
+            expired_set = set(expired)
+            stale = [(name, record) for name, record in stale if name not in expired_set]
+        return stale, expired, version
+
+
+# ---------- 告警规则引擎：规则从JSON配置文件加载，接收上报时按 规则x节点x对象 的状态增量判断，不扫描全部节点 ----------
+# 配置示例: {"log_file": "alerts.log", "command": "notify.sh", "rules": [
+#     {"name": "硬盘将满", "when": "disk.percent > 95"},
+#     {"name": "显存占用高", "when": "gpu.mem_percent > 90", "for": 1800},
+#     {"name": "GPU卡死", "when": "gpu.util >= 100 and gpu.power < 5", "for": 3600},
+#     {"name": "节点失联", "when": "silent > 600"}]}
+# for: 条件持续满足该秒数后才触发; clear_for: 触发后条件持续不满足该秒数才恢复(默认60)，两者共同抑制在阈值附近抖动的告警
+# 同一告警触发和恢复时各只通知一次
+def _percent(used, total):
+    return used / total * 100 if used is not None and total else None
+
+
+# 可用的指标: 名称 -> (作用对象, 取值函数)；node 对应整个节点，disk 每个挂载点，gpu 每块GPU
+ALERT_METRICS = {
+    "cpu.percent": ("node", lambda m: m["cpu"].get("percent")),
+    "cpu.temp": ("node", lambda m: m["cpu"].get("temp")),
+    "mem.percent": ("node", lambda m: _percent(m["memory"].get("used"), m["memory"].get("total"))),
+    "swap.percent": ("node", lambda m: _percent(m["memory"].get("swap_used"), m["memory"].get("swap_total"))),
+    "disk.percent": ("disk", lambda d: _percent(d["used"], d["total"])),
+    "disk.free": ("disk", lambda d: d["total"] - d["used"] if d["used"] is not None and d["total"] is not None else None),  # GB
+    "gpu.util": ("gpu", lambda g: g["util"]),
+    "gpu.mem_percent": ("gpu", lambda g: _percent(g["mem_used"], g["mem_total"])),
+    "gpu.mem_free": ("gpu", lambda g: g["mem_total"] - g["mem_used"] if g["mem_used"] is not None and g["mem_total"] is not None else None),  # MB
+    "gpu.power": ("gpu", lambda g: g["power"]),
+    "gpu.fan": ("gpu", lambda g: g["fan"]),
+    "silent": ("silent", None),  # 距上次上报的秒数，由清理线程按到期时间检查
+}
+ALERT_OPS = {">": float.__gt__, ">=": float.__ge__, "<": float.__lt__, "<=": float.__le__, "==": float.__eq__, "!=": float.__ne__}
+_re_condition = re.compile(r"^\s*([a-z_.]+)\s*(>=|<=|==|!=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+class AlertRule:
+    __slots__ = ("id", "name", "when", "scope", "conditions", "hold", "clear", "heap", "tracked")
+
+    def __init__(self, rule_id, config):
+        self.id = rule_id
+        self.name = str(config.get("name") or f"rule{rule_id}")
+        self.when = str(config.get("when") or "")
+        self.hold = float(config.get("for", 0))
+        self.clear = float(config.get("clear_for", 60))
+        self.conditions = []  # [(指标名, 取值函数, 比较函数, 阈值)]
+        scopes = set()
+        for part in re.split(r"\s+and\s+", self.when):
+            match = _re_condition.match(part)
+            if not match or match.group(1) not in ALERT_METRICS:
+                raise ValueError(f"规则 {self.name} 的条件无法解析: {part!r}，可用指标: {', '.join(ALERT_METRICS)}")
+            key, op, threshold = match.groups()
+            scope, getter = ALERT_METRICS[key]
+            # silent 由清理线程按到期时间检查，只能表示"超过多少秒未上报"
+            if scope == "silent" and op not in (">", ">="):
+                raise ValueError(f"规则 {self.name} 的 silent 条件只支持 > 或 >=: {part!r}")
+            scopes.add(scope)
+            self.conditions.append((key, getter, ALERT_OPS[op], float(threshold)))
+        if len(scopes) > 1:
+            raise ValueError(f"规则 {self.name} 的条件必须作用于同一类对象(节点/硬盘/GPU)，silent 只能单独使用")
+        self.scope = scopes.pop()
+        self.heap = []  # silent规则: 每个被跟踪的节点一个条目 (入堆时的接收时间, 节点名)，与离线索引相同的延迟更新方式
+        self.tracked = set()
+
+    def match(self, metrics):
+        """返回满足全部条件的 [(对象, 第一个条件的取值)]，对象为挂载点、"gpu<编号>" 或空字符串(整个节点)"""
+        if self.scope == "disk":
+            items = [(disk["mount"], disk) for disk in metrics["disks"]]
+        elif self.scope == "gpu":
+            items = [(f"gpu{gpu['index']}", gpu) for gpu in metrics["gpus"]]
+        else:
+            items = [("", metrics)]
+        matched = []
+        for entity, item in items:
+            values = [getter(item) for _, getter, _, _ in self.conditions]
+            if all(value is not None and op(float(value), threshold) for value, (_, _, op, threshold) in zip(values, self.conditions)):
+                matched.append((entity, values[0]))
+        return matched
+
+
+class AlertState:
+    __slots__ = ("rule", "node", "entity", "since", "value", "firing", "fired_at", "clear_since")
+
+    def __init__(self, rule, node, entity, since):
+        self.rule = rule
+        self.node = node
+        self.entity = entity
+        self.since = since  # 条件开始满足的时间(monotonic)
+        self.value = None  # 最近一次的取值
+        self.firing = False
+        self.fired_at = None  # 触发时间(epoch秒)
+        self.clear_since = None  # 触发后条件开始不满足的时间(monotonic)
+
+
+class AlertEngine:
+    RECENT_KEEP = 100  # 保留最近的触发/恢复记录条数
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.lock = threading.Lock()
+        self.states = {}  # 节点名 -> {(规则ID, 对象): AlertState}，只包含条件满足中或已触发的条目
+        self.seen = {}  # 节点名 -> 最后接收时间(monotonic)，用于silent规则
+        self.firing = {}  # (规则ID, 节点名, 对象) -> 已触发的 AlertState，用于页面展示
+        self.recent = deque(maxlen=self.RECENT_KEEP)
+        self.version = 0  # 告警状态变化次数
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls([AlertRule(i, rule) for i, rule in enumerate(config.get("rules") or [])]), config
+
+    def observe_many(self, items):
+        """处理一批 [(节点名, 数值指标或None, 接收时间monotonic)]，None表示心跳(只影响silent规则)，返回触发/恢复事件列表"""
+        events = []
+        with self.lock:
+            for name, metrics, seen in items:
+                # 单个节点的指标异常只跳过该节点的规则判断
+                try:
+                    self._observe(name, metrics, seen, events)
+                except Exception as e:
+                    error_log.log(type(e).__name__, f"判断节点 {name} 的告警规则失败: {e}")
+        return events
+
+    def _observe(self, name, metrics, now, events):
+        # 需持有self.lock
+        self.seen[name] = now
+        states = self.states.get(name)
+        active = set()
+        for rule in self.rules:
+            if rule.scope == "silent":
+                if name not in rule.tracked:
+                    rule.tracked.add(name)
+                    heapq.heappush(rule.heap, (now, name))
+                continue
+            if metrics is None:
+                continue
+            for entity, value in rule.match(metrics):
+                key = (rule.id, entity)
+                active.add(key)
+                if states is None:
+                    states = self.states[name] = {}
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = AlertState(rule, name, entity, now)
+                state.value = round(value, 2)
+                state.clear_since = None
+                if not state.firing and now - state.since >= rule.hold:
+                    self._fire(state, events)
+        if not states:
+            return
+        for key, state in list(states.items()):
+            if key in active or (metrics is None and state.rule.scope != "silent"):
+                continue
+            if not state.firing:
+                del states[key]
+                continue
+            if state.clear_since is None:
+                state.clear_since = now
+            if now - state.clear_since >= state.rule.clear:
+                del states[key]
+                self._resolve(state, events)
+        if not states:
+            del self.states[name]
+
+    def check_silent(self, now=None):
+        """弹出silent规则到期的堆条目，返回触发事件列表；节点再次上报时由 _observe 按普通条件恢复"""
+        now = time.monotonic() if now is None else now
+        events = []
+        with self.lock:
+            for rule in self.rules:
+                if rule.scope != "silent":
+                    continue
+                threshold = rule.conditions[0][3]
+                heap = rule.heap
+                while heap and heap[0][0] <= now - threshold:
+                    seen, name = heapq.heappop(heap)
+                    latest = self.seen.get(name)
+                    if latest is not None and latest != seen:
+                        heapq.heappush(heap, (latest, name))
+                        continue
+                    rule.tracked.discard(name)
+                    if latest is None:
+                        continue
+                    state = self.states.setdefault(name, {}).setdefault((rule.id, ""), AlertState(rule, name, "", seen))
+                    state.value = round(now - seen)
+                    state.clear_since = None
+                    if not state.firing:
+                        self._fire(state, events)
+        return events
+
+    def forget(self, names):
+        """删除节点时恢复其全部告警并清除状态，返回恢复事件列表"""
+        events = []
+        with self.lock:
+            for name in names:
+                self.seen.pop(name, None)
+                for state in (self.states.pop(name, None) or {}).values():
+                    if state.firing:
+                        self._resolve(state, events)
+        return events
+
+    def _fire(self, state, events):
+        state.firing = True
+        state.fired_at = time.time()
+        self.firing[(state.rule.id, state.node, state.entity)] = state
+        events.append(self._event("firing", state, state.fired_at))
+
+    def _resolve(self, state, events):
+        self.firing.pop((state.rule.id, state.node, state.entity), None)
+        events.append(self._event("resolved", state, time.time()))
+
+    def _event(self, kind, state, when):
+        event = {"event": kind, "rule": state.rule.name, "when": state.rule.when, "node": state.node, "target": state.entity, "value": state.value, "time": int(when), "since": int(state.fired_at)}
+        self.version += 1
+        self.recent.append(event)
+        return event
+
+    def recent_events(self):
+        with self.lock:
+            return list(self.recent)
+
+    def active(self):
+        """返回已触发告警的列表，按触发时间排序"""
+        with self.lock:
+            states = sorted(self.firing.values(), key=lambda state: state.fired_at)
+            return [
+                {"rule": state.rule.name, "when": state.rule.when, "node": state.node, "target": state.entity, "value": state.value, "since": int(state.fired_at)}
+                for state in states
+            ]
+
+
+# ---------- 告警通知线程：把触发/恢复事件追加到本地文件(每行一个JSON)或通过标准输入传给外部命令，不阻塞接收线程 ----------
+class AlertNotifier:
+    def __init__(self, log_file, command, max_queue=10000):
+        self.log_file = log_file
+        self.command = command
+        self.queue = queue.Queue(max_queue)
+
+    def put(self, events):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                error_log.log("alert_queue", "告警通知队列已满，丢弃通知")
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            line = json.dumps(event, ensure_ascii=False)
+            if self.log_file:
+                try:
+                    with open(self.log_file, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+                except OSError as e:
+                    error_log.log("alert_file", f"写入告警文件失败: {e}")
+            if self.command:
+                try:
+                    subprocess.run(self.command, shell=True, input=(line + "\n").encode("utf-8"), timeout=30, check=True)
+                except (OSError, subprocess.SubprocessError) as e:
+                    error_log.log("alert_command", f"执行告警命令失败: {e}")
+
+
 # ---------- 全局变量：存储节点信息和白名单 ----------
-nodes = {}
-nodes_lock = threading.Lock()
+registry = NodeRegistry()  # 离线/过期阈值在main中按参数设置
 white_set = set()
 
+# ---------- 页面渲染缓存：每个数据版本只渲染一次 ----------
+# render_caches 中每项为不可变元组 (版本号, ETag, 响应字节, gzip压缩后的字节)，整体替换，读取时无需加锁
+boot_id = f"{int(time.time()):x}"  # 进程启动标识，避免重启后版本号重复导致ETag冲突
+render_caches = {}
+render_lock = threading.Lock()
+
+state_store = None  # 指定 --data_dir 时在main中创建的持久化存储
+event_hub = None  # 实时推送(SSE)管理器，在main中创建
+alert_engine = None  # 指定 --alert_rules 时在main中创建的告警规则引擎
+alert_notifier = None
+
+# ---------- 数据接收统计计数器 ----------
+ingest_stats = {
+    "received": 0,  # 收到的UDP数据包
+    "parsed": 0,  # 成功解码的上报
+    "stored": 0,  # 写入内存的上报
+    "incomplete": 0,  # 分片尚未收齐的数据包
+    "dropped_whitelist": 0,  # 不在白名单中被丢弃
+    "dropped_duplicate": 0,  # 重复上报被丢弃(旧版slave为100秒内的重复上报)
+    "dropped_error": 0,  # 解析失败被丢弃
+    "heartbeats": 0,  # 增量模式下的心跳
+    "resync_requests": 0,  # 因序号缺失请求slave重同步的次数
+    "bundles": 0,  # 收到的下级中继包裹
+    "relayed": 0,  # 中继模式下转发给上级的节点数据条数
+    "relay_datagrams": 0,  # 中继模式下发送给上级的数据报
+}
+ingest_stats_lock = threading.Lock()
+data_port = 0
+
+# ---------- 历史数据配置：分层环形缓冲区 (聚合步长秒数, 槽位数) ----------
+# 原始层每个上报一个槽位(120秒一次, 约6小时), 10分钟层约2天, 1小时层约30天
+# 每个槽位占 4+4+4+4+2=18 字节, 单个指标约 21KB, 内存占用固定可预估
+HISTORY_TIERS = ((0, 180), (600, 288), (3600, 720))
+HISTORY_MAX_SERIES = 128  # 每个节点最多保存的指标序列数
+history = {}
+history_lock = threading.Lock()
+
 
 # ---------- 解析白名单字符串，构建白名单集合 ----------
 def build_white_set(white_str: str):
@@ -49,87 +679,1170 @@ def build_white_set(white_str: str):
     return white_set
 
 
-# ---------- 后台清理线程：定期清理超时的节点信息 ----------
-def cleanup_dead():
+# ---------- 限频日志：同类日志在时间窗口内只输出一次，并统计被省略的条数 ----------
+class LogLimiter:
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.last = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def log(self, key, message):
+        now = time.monotonic()
+        with self.lock:
+            if key in self.last and now - self.last[key] < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return
+            self.last[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+        print(message + (f" (此前 {self.interval} 秒内另有 {suppressed} 条同类错误)" if suppressed else ""))
+
 
-    # 辅助函数：检查时间戳是否超过2小时
-    def _older_than_2h(time_str, now):
-        if not time_str:
-            return True
+error_log = LogLimiter()
+
+
+# ---------- 将 "%Y-%m-%d %H:%M:%S" 格式的时间字符串转换为epoch秒，比 strptime 快 ----------
+def parse_ts(text):
+    if len(text) != 19 or text[4] != "-" or text[10] != " ":
+        raise ValueError(f"时间格式错误: {text!r}")
+    return int(time.mktime((int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19]), 0, 0, -1)))
+
+
+# ---------- 从节点上报数据中提取数值指标 ----------
+_re_num = re.compile(r"[.0-9]+")
+_re_tag = re.compile(r"<[^>]*>")
+_re_cpu = re.compile(r"CPU <span[^>]*>([.0-9]+)%")
+_re_temp = re.compile(r"温度 <span[^>]*>([.0-9]+)°C")
+
+
+def _to_float(value):
+    """将数值或带单位的字符串(如 '45%', '<span>100MB/200MB</span>')转换为浮点数, 无法解析时返回None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = _re_num.search(_re_tag.sub("", value))
+    try:
+        return float(match.group(0)) if match else None
+    except ValueError:
+        return None
+
+
+def normalize_metrics(raw):
+    """将新版slave上报的数值指标整理为统一结构，缺失的部分置为空"""
+    cpu = raw.get("cpu") or {}
+    mem = raw.get("memory") or {}
+    metrics = {
+        "cpu": {"percent": _to_float(cpu.get("percent")), "temp": _to_float(cpu.get("temp")), "count": int(cpu["count"]) if cpu.get("count") else None},
+        "memory": {key: _to_float(mem.get(key)) for key in ("total", "used", "swap_total", "swap_used")},
+        "disks": [{"mount": str(d.get("mount")), "total": _to_float(d.get("total")), "used": _to_float(d.get("used"))} for d in raw.get("disks") or []],
+        "gpus": [
+            {"index": int(g.get("index", i)), **{key: _to_float(g.get(key)) for key in ("util", "mem_used", "mem_total", "fan", "power")}}
+            for i, g in enumerate(raw.get("gpus") or [])
+        ],
+    }
+    # 后台采样的slave额外上报窗口内的 min/max/p95 和每核统计
+    if cpu.get("p95") is not None:
+        for key in ("min", "max", "p95"):
+            metrics["cpu"][key] = _to_float(cpu.get(key))
+        metrics["cpu"]["cores"] = [{key: _to_float(core.get(key)) for key in ("min", "avg", "max", "p95")} for core in cpu.get("cores") or []]
+    # 占用资源最多的用户(未启用统计的slave没有该字段)
+    metrics["users"] = [
+        {
+            "user": str(u.get("user")),
+            **{key: _to_float(u.get(key)) or 0.0 for key in ("cpu", "rss", "gpu_mem")},
+            "procs": int(u.get("procs") or 0),
+            "since": int(u["since"]) if u.get("since") else None,
+        }
+        for u in raw.get("users") or []
+    ]
+    return metrics
+
+
+def extract_metrics(node_info):
+    """
+    从slave上报的JSON中提取类型化的数值指标，新版slave直接携带 metrics 字段，旧版需解析显示字符串
+    输出示例: {"cpu": {"percent": 12.5, "temp": 45.0}, "memory": {...}, "disks": [...], "gpus": [...]}
+    """
+    if isinstance(node_info.get("metrics"), dict):
+        return normalize_metrics(node_info["metrics"])
+    cpu_display = node_info.get("cpu", {}).get("display", "")
+    cpu_match = _re_cpu.search(cpu_display)
+    temp_match = _re_temp.search(cpu_display)
+    metrics = {
+        "cpu": {
+            "percent": float(cpu_match.group(1)) if cpu_match else None,
+            "temp": float(temp_match.group(1)) if temp_match else None,
+        },
+        "memory": {},
+        "disks": [],
+        "gpus": [],
+        "users": [],
+    }
+    mem = node_info.get("memory", {}).get("memory_detail", {})
+    for key in ("total", "used", "swap_total", "swap_used"):
+        metrics["memory"][key] = _to_float(mem.get(key))
+    for disk in node_info.get("disk", {}).get("disk_detail", []):
+        metrics["disks"].append({"mount": disk.get("mount"), "total": _to_float(disk.get("total")), "used": _to_float(disk.get("used"))})
+    for i, gpu in enumerate(node_info.get("gpu", {}).get("gpu_detail", [])):
+        # 显存字段格式: '<span ...>{used}MB/{total}MB={ratio}%</span>'
+        mem_parts = _re_num.findall(_re_tag.sub("", gpu.get("memory", "")))
+        metrics["gpus"].append(
+            {
+                "index": gpu.get("index", i),
+                "util": _to_float(gpu.get("util")),
+                "mem_used": float(mem_parts[0]) if len(mem_parts) > 0 else None,
+                "mem_total": float(mem_parts[1]) if len(mem_parts) > 1 else None,
+                "fan": _to_float(gpu.get("fan")),
+                "power": _to_float(gpu.get("power")),
+            }
+        )
+    return metrics
+
+
+def flatten_metrics(metrics):
+    """将类型化指标展开为 {序列名: 数值}, 用于写入历史数据"""
+    flat = {
+        "cpu": metrics["cpu"].get("percent"),
+        "cpu.p95": metrics["cpu"].get("p95"),
+        "mem_used": metrics["memory"].get("used"),
+        "swap_used": metrics["memory"].get("swap_used"),
+    }
+    for disk in metrics["disks"]:
+        flat[f"disk:{disk['mount']}"] = disk["used"]
+    for gpu in metrics["gpus"]:
+        prefix = f"gpu{gpu['index']}"
+        flat[f"{prefix}.util"] = gpu["util"]
+        flat[f"{prefix}.mem"] = gpu["mem_used"]
+        flat[f"{prefix}.power"] = gpu["power"]
+        flat[f"{prefix}.fan"] = gpu["fan"]
+    return {key: value for key, value in flat.items() if value is not None}
+
+
+# ---------- 紧凑二进制上报格式(与slave的 encode_report/pack_datagrams 对应) ----------
+# 每个UDP数据报: 头部 "!4sBBIBB" = 魔数 FMLW, 格式版本, 标志位(bit0=zlib压缩), 消息ID, 分片序号, 分片总数
+# 分片拼接(并按需解压)后为若干段: 段类型 u8 + 段长度 u16 + 段内容，不认识的段类型直接跳过
+WIRE_MAGIC = b"FMLW"
+WIRE_VERSION = 1
+WIRE_HEADER = struct.Struct("!4sBBIBB")
+WIRE_FLAG_ZLIB = 0x01
+SEC_IDENT, SEC_CPU, SEC_MEMORY, SEC_DISKS, SEC_GPUS, SEC_CPU_STATS, SEC_USERS, SEC_SEQ, SEC_TIMINGS = 1, 2, 3, 4, 5, 6, 7, 8, 9
+KIND_FULL, KIND_DELTA, KIND_HEARTBEAT = 0, 1, 2  # 序号段中的上报类型：全量、增量、心跳
+RESYNC_MAGIC = b"FMLR"  # 发现序号缺失时回复 FMLR + 会话ID(u32)，要求slave下一次发送全量
+RAW_GROUPS = ("cpu", "memory", "disks", "gpus", "users")
+
+
+class Reassembler:
+    """按 (发送地址, 消息ID) 重组分片，超时、数量或缓存字节数超限的未完成消息会被丢弃"""
+
+    def __init__(self, timeout=10, max_pending=4096, max_message=2 * 1024 * 1024, max_bytes=64 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_message = max_message  # 单条消息重组后的字节数上限(中继包裹压缩后最大约2MB)
+        self.max_bytes = max_bytes  # 所有未完成消息缓存的分片总字节数上限
+        self.pending = {}  # (addr, msg_id) -> [到达时间, 分片列表, 已收到分片数, 已缓存字节数]，按创建时间顺序插入
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, data, addr):
+        """加入一个数据报，消息完整时返回 (标志位, 负载字节)，否则返回None"""
+        magic, version, flags, msg_id, index, count = WIRE_HEADER.unpack_from(data)
+        if version != WIRE_VERSION:
+            raise ValueError(f"不支持的二进制格式版本 {version}")
+        if count <= 1:
+            return flags, data[WIRE_HEADER.size :]
+        if index >= count:
+            raise ValueError(f"分片序号越界 {index}/{count}")
+        chunk = data[WIRE_HEADER.size :]
+        # 除最后一个分片外各分片大小相同，按当前分片估算整条消息的大小
+        if count * len(chunk) > self.max_message and index < count - 1:
+            raise ValueError(f"分片消息过大 ({count} 个 {len(chunk)} 字节的分片)")
+        key = (addr, msg_id)
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now, len(chunk))
+            entry = self.pending.get(key)
+            if entry is None:
+                self._evict(1, 0)
+                entry = self.pending[key] = [now, [None] * count, 0, 0]
+            if entry[1][index] is None:
+                entry[1][index] = chunk
+                entry[2] += 1
+                entry[3] += len(chunk)
+                self.bytes += len(chunk)
+            if entry[2] < count:
+                return None
+            del self.pending[key]
+            self.bytes -= entry[3]
+        return flags, b"".join(entry[1])
+
+    def _expire(self, now, incoming):
+        # 需持有self.lock；按创建顺序弹出超时的未完成消息，只检查最旧的几条，每次调用的开销与未完成消息数无关
+        while self.pending:
+            key = next(iter(self.pending))
+            if now - self.pending[key][0] <= self.timeout:
+                break
+            self.bytes -= self.pending.pop(key)[3]
+        self._evict(0, incoming)
+
+    def _evict(self, entries, incoming):
+        # 需持有self.lock；为新消息或新分片腾出空间，仍然超出上限时丢弃最旧的
+        while self.pending and (len(self.pending) + entries > self.max_pending or self.bytes + incoming > self.max_bytes):
+            self.bytes -= self.pending.pop(next(iter(self.pending)))[3]
+
+
+reassembler = Reassembler()
+
+
+def _unpack_str(buf, pos):
+    (length,) = struct.unpack_from("!H", buf, pos)
+    return buf[pos + 2 : pos + 2 + length].decode("utf-8"), pos + 2 + length
+
+
+def _none_if_nan(value):
+    # float32 解码后保留两位小数，去掉精度噪声
+    return None if math.isnan(value) else round(value, 2)
+
+
+def decode_report(flags, payload):
+    """
+    解码二进制上报内容，返回 (节点名, IP, 时间戳epoch, 数值指标, 序号)
+    数值指标只包含上报中出现的分组；序号为 (会话ID, 序号, 类型)，旧版slave没有序号段时为None
+    """
+    if flags & WIRE_FLAG_ZLIB:
+        # 限制解压后的大小，防止异常数据占用过多内存
+        payload = zlib.decompressobj().decompress(payload, 1024 * 1024)
+    raw = {}
+    name = ip = ts = seq = None
+    pos = 0
+    while pos + 3 <= len(payload):
+        tag, length = struct.unpack_from("!BH", payload, pos)
+        body = payload[pos + 3 : pos + 3 + length]
+        pos += 3 + length
+        if tag == SEC_IDENT:
+            name, p = _unpack_str(body, 0)
+            ip, p = _unpack_str(body, p)
+            (ts,) = struct.unpack_from("!I", body, p)
+        elif tag == SEC_SEQ:
+            seq = struct.unpack_from("!IIB", body)
+        elif tag == SEC_TIMINGS:
+            # slave各采集函数的耗时(秒)，只用于自监控，不属于节点数据
+            raw["timings"], p = {}, 1
+            for _ in range(body[0]):
+                key, p = _unpack_str(body, p)
+                raw["timings"][key] = struct.unpack_from("!f", body, p)[0]
+                p += 4
+        elif tag == SEC_CPU:
+            percent, temp = struct.unpack_from("!ff", body)
+            raw["cpu"] = {**raw.get("cpu", {}), "percent": _none_if_nan(percent), "temp": _none_if_nan(temp)}
+            # 新版slave在末尾附加CPU核数
+            if len(body) >= 10:
+                raw["cpu"]["count"] = struct.unpack_from("!H", body, 8)[0] or None
+        elif tag == SEC_CPU_STATS:
+            cpu_min, cpu_max, p95, count = struct.unpack_from("!fffH", body)
+            cores = [dict(zip(("min", "avg", "max", "p95"), (v / 100 for v in struct.unpack_from("!HHHH", body, 14 + k * 8)))) for k in range(count)]
+            raw["cpu"] = {**raw.get("cpu", {}), "min": _none_if_nan(cpu_min), "max": _none_if_nan(cpu_max), "p95": _none_if_nan(p95), "cores": cores}
+        elif tag == SEC_MEMORY:
+            raw["memory"] = dict(zip(("total", "used", "swap_total", "swap_used"), (_none_if_nan(v) for v in struct.unpack_from("!ffff", body))))
+        elif tag == SEC_DISKS:
+            raw["disks"], p = [], 1
+            for _ in range(body[0]):
+                mount, p = _unpack_str(body, p)
+                total, used = struct.unpack_from("!II", body, p)
+                p += 8
+                raw["disks"].append({"mount": mount, "total": total, "used": used})
+        elif tag == SEC_USERS:
+            raw["users"], p = [], 1
+            for _ in range(body[0]):
+                user, p = _unpack_str(body, p)
+                cpu, rss, gpu_mem, procs, since = struct.unpack_from("!fffHI", body, p)
+                p += 18
+                raw["users"].append({"user": user, "cpu": round(cpu, 2), "rss": round(rss, 2), "gpu_mem": round(gpu_mem, 1), "procs": procs, "since": since or None})
+        elif tag == SEC_GPUS:
+            raw["gpus"] = []
+            for k in range(body[0]):
+                index, *values = struct.unpack_from("!Bfffff", body, 1 + k * 21)
+                raw["gpus"].append({"index": index, **dict(zip(("util", "mem_used", "mem_total", "fan", "power"), (_none_if_nan(v) for v in values)))})
+    if name is None:
+        raise ValueError("二进制上报缺少节点标识段")
+    return name, ip, ts, raw, seq
+
+
+# ---------- 根据百分比数值返回对应的颜色代码(与slave一致) ----------
+def get_color_by_percent(percent):
+    try:
+        p = float(percent)
+        assert p >= 0 and p <= 100
+    except:
+        return "#000000"
+    # 绿色(低)<蓝色<橙色<红色(高)
+    if p < 20:
+        return "#22aa22"  # 绿
+    elif p < 50:
+        return "#2288ee"  # 蓝
+    elif p < 80:
+        return "#ee8800"  # 橙
+    else:
+        return "#ee2222"  # 红
+
+
+def _fmt(value, spec="g"):
+    return "N/A" if value is None else format(value, spec)
+
+
+# ---------- 由数值指标生成与旧版slave相同结构的显示信息，二进制上报的展示在master完成 ----------
+def build_display_info(name, ip, ts, raw):
+    raw = {**dict.fromkeys(RAW_GROUPS), **raw}
+    cpu = raw["cpu"] or {}
+    cpu_parts = []
+    percent, temp = cpu.get("percent"), cpu.get("temp")
+    cpu_parts.append("无法获取 CPU 使用率" if percent is None else f'CPU <span style="color:{get_color_by_percent(percent)}">{percent:.2f}%</span>')
+    if percent is not None and cpu.get("p95") is not None:
+        cpu_parts[-1] += f' (P95 {cpu["p95"]:.2f}% 最大 {cpu["max"]:.2f}%)'
+    cpu_parts.append("无法获取温度" if temp is None else f'温度 <span style="color:{get_color_by_percent(min(temp, 100))}">{temp:.1f}°C</span>')
+
+    mem = raw["memory"]
+    if mem:
+        mem_percent = (mem["used"] / mem["total"] * 100) if mem["total"] > 0 else 0
+        swap_percent = (mem["swap_used"] / mem["swap_total"] * 100) if mem["swap_total"] > 0 else 0
+        mem_display = (
+            f'内存 {mem["used"]:.2f}GB/{mem["total"]:.2f}GB=<span style="color:{get_color_by_percent(mem_percent)}">{mem_percent:.2f}%</span>'
+            f'<br>Swap {mem["swap_used"]:.2f}GB/{mem["swap_total"]:.2f}GB=<span style="color:{get_color_by_percent(swap_percent)}">{swap_percent:.2f}%</span>'
+        )
+    else:
+        mem_display = "无法获取"
+
+    disk_list = []
+    for disk in raw["disks"] or []:
+        percent = (disk["used"] / disk["total"] * 100) if disk["total"] > 0 else 0
+        disk_list.append(f'{disk["mount"]} {disk["used"]}GB/{disk["total"]}GB=<span style="color:{get_color_by_percent(percent)}">{percent:.2f}%</span>')
+    disk_display = "无法获取" if raw["disks"] is None else ("<br>".join(disk_list) or "无硬盘")
+
+    gpu_list = []
+    for gpu in raw["gpus"] or []:
         try:
-            node_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-            return node_time < now - timedelta(hours=2)
-        except Exception:
-            return True
+            mem_ratio = gpu["mem_used"] / gpu["mem_total"] * 100
+        except:
+            mem_ratio = 0
+        util_color = get_color_by_percent(gpu["util"])
+        mem_color = get_color_by_percent(mem_ratio)
+        gpu_list.append(
+            f'[GPU{gpu["index"]}]<br>使用 <span style="color:{util_color}">{_fmt(gpu["util"])}%</span> 风扇 {_fmt(gpu["fan"])}% 功率 {_fmt(gpu["power"])}W'
+            f'<br>显存 <span style="color:{mem_color}">{_fmt(gpu["mem_used"])}MB/{_fmt(gpu["mem_total"])}MB={mem_ratio:.2f}%</span>'
+        )
+    gpu_display = "出错" if raw["gpus"] is None else ("<br>".join(gpu_list) or "无GPU")
+
+    return {
+        "name": {"display": name},
+        "ip": {"display": ip},
+        "cpu": {"display": "<br>".join(cpu_parts)},
+        "memory": {"display": mem_display},
+        "disk": {"display": disk_display},
+        "gpu": {"display": gpu_display},
+        "timestamp": {"display": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))},
+    }
+
+
+# ---------- 解析一个UDP数据报，分片未收齐时返回None ----------
+def parse_packet(data, addr):
+    """
+    返回 (节点名, IP, 上报时间epoch秒, 节点信息, 数值指标, 序号, 原始数值指标)
+    带序号的增量/心跳上报需要在锁内与已有数据合并，此时节点信息和数值指标为None
+    """
+    if data[:4] == WIRE_MAGIC:
+        # 二进制格式：先重组分片，再解码并在master端生成显示信息
+        message = reassembler.add(data, addr)
+        if message is None:
+            return None
+        name, ip, ts, raw, seq = decode_report(*message)
+        observe_slave_timings(raw.pop("timings", None))
+        if seq is not None and seq[2] != KIND_FULL:
+            return name, ip, ts, None, None, seq, raw
+        raw = {**dict.fromkeys(RAW_GROUPS), **raw}
+        return name, ip, ts, build_display_info(name, ip, ts, raw), normalize_metrics(raw), seq, raw
+    # 兼容旧版JSON格式，新版slave在metrics中携带epoch时间戳
+    node_info = json.loads(data.decode("utf-8"))
+    observe_slave_timings((node_info.get("metrics") or {}).get("timings"))
+    ts = (node_info.get("metrics") or {}).get("ts")
+    if not isinstance(ts, int):
+        ts = parse_ts(node_info["timestamp"]["display"])
+    return node_info["name"]["display"], node_info["ip"]["display"], ts, node_info, extract_metrics(node_info), None, None
+
+
+# ---------- 合并带序号的上报(只在会话锁内更新序号和合并状态，显示信息在锁外生成) ----------
+def apply_sequenced(name, ip, ts, node_info, metrics, seq, raw):
+    """
+    返回 (动作, 节点信息, 数值指标, 是否需要重同步)，动作为 store/heartbeat/duplicate/resync
+    全量上报替换该节点的合并状态；增量上报按分组覆盖；心跳只刷新存活时间
+    """
+    session, number, kind = seq
+    with registry.seq_lock:
+        state = registry.sessions.get(name)
+        same_session = state is not None and state[0] == session
+        if same_session and number <= state[1]:
+            return "duplicate", None, None, False
+        if kind == KIND_FULL:
+            registry.sessions[name] = [session, number, raw]
+            return "store", node_info, metrics, False
+        if not same_session:
+            # 没有该会话的全量数据(如master重启或slave重启后全量丢失)，无法合并
+            return "resync", None, None, True
+        gap = number != state[1] + 1
+        state[1] = number
+        if kind == KIND_HEARTBEAT:
+            return "heartbeat", None, None, gap
+        state[2] = merged = {**state[2], **raw}
+    return "store", build_display_info(name, ip, ts, merged), normalize_metrics(merged), gap
+
+
+# ---------- 环形缓冲区：预分配数组存储单个指标在某一聚合层的 min/max/avg ----------
+class MetricRing:
+    __slots__ = ("step", "capacity", "ts", "vmin", "vmax", "vsum", "count", "head", "size")
+
+    def __init__(self, step, capacity):
+        self.step = step  # 聚合步长(秒), 0表示原始数据每个样本一个槽位
+        self.capacity = capacity
+        self.ts = array("I", [0]) * capacity  # 槽位起始时间(epoch秒)
+        self.vmin = array("f", [0.0]) * capacity
+        self.vmax = array("f", [0.0]) * capacity
+        self.vsum = array("f", [0.0]) * capacity
+        self.count = array("H", [0]) * capacity
+        self.head = -1  # 最新槽位下标
+        self.size = 0
+
+    def add(self, ts, value):
+        start = ts - ts % self.step if self.step else ts
+        h = self.head
+        # 同一聚合桶内则原地更新 min/max/sum/count
+        if self.step and self.size and self.ts[h] == start and self.count[h] < 0xFFFF:
+            self.vmin[h] = min(self.vmin[h], value)
+            self.vmax[h] = max(self.vmax[h], value)
+            self.vsum[h] += value
+            self.count[h] += 1
+            return
+        # 否则前进到下一个槽位, 覆盖最旧的数据
+        h = (h + 1) % self.capacity
+        self.head = h
+        self.ts[h] = start
+        self.vmin[h] = self.vmax[h] = self.vsum[h] = value
+        self.count[h] = 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def export(self):
+        """按时间顺序导出已使用的槽位，返回各数组的字节(用于快照，未使用的槽位不写入)"""
+        start = (self.head - self.size + 1) % self.capacity
+        parts = []
+        for arr in (self.ts, self.vmin, self.vmax, self.vsum, self.count):
+            used = arr[start : start + self.size] if start + self.size <= self.capacity else arr[start:] + arr[: self.head + 1]
+            parts.append(used.tobytes())
+        return parts
+
+    def load(self, buf, offset, size):
+        """从快照内存中按时间顺序载入size个槽位，返回读取后的偏移"""
+        for arr in (self.ts, self.vmin, self.vmax, self.vsum, self.count):
+            nbytes = arr.itemsize * size
+            arr[:size] = array(arr.typecode, buf[offset : offset + nbytes])
+            offset += nbytes
+        self.head = size - 1
+        self.size = size
+        return offset
+
+    def points(self, since=0):
+        """按时间顺序返回 [(时间戳, min, max, avg), ...]"""
+        result = []
+        for k in range(self.size):
+            i = (self.head - self.size + 1 + k) % self.capacity
+            if self.ts[i] >= since:
+                result.append((self.ts[i], self.vmin[i], self.vmax[i], self.vsum[i] / self.count[i]))
+        return result
+
+
+# ---------- 历史数据写入与查询 ----------
+def record_history(node_name, metrics, ts):
+    flat = flatten_metrics(metrics)
+    with history_lock:
+        series = history.setdefault(node_name, {})
+        for key, value in flat.items():
+            rings = series.get(key)
+            if rings is None:
+                if len(series) >= HISTORY_MAX_SERIES:
+                    continue
+                rings = series[key] = tuple(MetricRing(step, capacity) for step, capacity in HISTORY_TIERS)
+            for ring in rings:
+                ring.add(ts, value)
+
+
+def query_history(node_name, key, step, since=0):
+    """返回某节点某指标在指定聚合层的数据点, 节点或指标不存在时返回None"""
+    with history_lock:
+        rings = history.get(node_name, {}).get(key)
+        if rings is None:
+            return None
+        for ring in rings:
+            if ring.step == step:
+                return ring.points(since)
+    return None
+
+
+# ---------- 持久化存储：内存映射的追加日志 + 定期快照，master重启后快速恢复 ----------
+# 日志分段文件 <序号>.seg 预分配固定大小并整体mmap，每条记录为 长度u32 + CRC32 u32 + JSON，长度为0表示段内数据结束
+# 快照文件 snapshot.bin = 魔数 + 头部长度u32 + JSON头部(节点数据、历史数据布局、起始日志段) + 历史环形缓冲区已使用槽位的原始数组字节
+class StateStore:
+    RECORD_HEADER = struct.Struct("!II")
+    SNAPSHOT_MAGIC = b"FMLSNAP1"
+
+    def __init__(self, data_dir, segment_size):
+        os.makedirs(data_dir, exist_ok=True)
+        self.dir = data_dir
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.segment_id = None
+        self.next_id = 1  # 下一个可用的日志段序号，预先创建日志段时在锁内预留
+        self.spare = None  # 后台线程预先创建的下一个日志段 (序号, (文件, 映射))，写满时在锁内直接切换
+        self.file = None
+        self.mm = None
+        self.pos = 0
+        self.dirty = False
+
+    def segment_ids(self):
+        return sorted(int(f[:-4]) for f in os.listdir(self.dir) if f.endswith(".seg") and f[:-4].isdigit())
+
+    def segment_path(self, segment_id):
+        return os.path.join(self.dir, f"{segment_id:010d}.seg")
+
+    def create_segment(self, segment_id):
+        """创建并映射日志段文件，返回 (文件, 映射)，不需要持有锁"""
+        f = open(self.segment_path(segment_id), "w+b")
+        f.truncate(self.segment_size)
+        return f, mmap.mmap(f.fileno(), self.segment_size)
+
+    @staticmethod
+    def close_segment(segment):
+        """写回并关闭 (文件, 映射)，不需要持有锁"""
+        f, mm = segment
+        if mm is not None:
+            mm.flush()
+            mm.close()
+            f.close()
+
+    def switch_segment(self, segment_id, segment):
+        # 需持有self.lock；只切换引用，返回旧日志段 (文件, 映射)
+        old = (self.file, self.mm)
+        self.file, self.mm = segment
+        self.segment_id = segment_id
+        self.next_id = max(self.next_id, segment_id + 1)
+        self.pos = 0
+        self.dirty = False
+        return old
+
+    def open_segment(self, segment_id):
+        """关闭当前日志段(需持有self.lock)，创建并映射新的日志段"""
+        self.close_segment(self.switch_segment(segment_id, self.create_segment(segment_id)))
+
+    def discard_segment(self, prepared):
+        """关闭并删除未使用的预创建日志段，不需要持有锁"""
+        segment_id, segment = prepared
+        self.close_segment(segment)
+        try:
+            os.remove(self.segment_path(segment_id))
+        except FileNotFoundError:
+            pass
+
+    def prepare_roll(self):
+        """取出预先创建的日志段，没有时预留下一个序号并在锁外创建文件，返回 (序号, (文件, 映射))，之后交给 roll 切换"""
+        with self.lock:
+            prepared, self.spare = self.spare, None
+            if prepared is None:
+                segment_id = self.next_id
+                self.next_id += 1
+        return prepared or (segment_id, self.create_segment(segment_id))
 
-    # 持续运行的清理循环
+    def prepare_spare(self):
+        """在锁外预先创建下一个日志段，供 append 写满时切换；已有时不重复创建"""
+        with self.lock:
+            if self.spare is not None:
+                return
+        prepared = self.prepare_roll()
+        with self.lock:
+            if self.spare is None:
+                self.spare, prepared = prepared, None
+        # 其他线程同时创建了预备日志段，多出的一个直接删除
+        if prepared is not None:
+            self.discard_segment(prepared)
+
+    def roll(self, prepared):
+        """切换到预先创建的日志段，返回 (新日志段序号, 旧日志段)；锁内只切换引用，旧日志段由调用方在锁外 close_segment"""
+        segment_id, segment = prepared
+        with self.lock:
+            if segment_id > self.segment_id:
+                return segment_id, self.switch_segment(segment_id, segment)
+            # 期间日志段写满已切换到序号更大的日志段，回放按序号顺序，预先创建的日志段不能再使用，只能同步创建(很少发生)
+            self.open_segment(self.next_id)
+            new_id = self.segment_id
+        self.close_segment(segment)
+        os.remove(self.segment_path(segment_id))
+        return new_id, (None, None)
+
+    def append(self, record):
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        size = self.RECORD_HEADER.size + len(data)
+        if size + self.RECORD_HEADER.size > self.segment_size:
+            error_log.log("store_size", f"记录过大({size} 字节)，超过日志段大小，未写入日志")
+            return
+        # 锁内只切换到预先创建的日志段，创建新文件、写回和关闭旧日志段都在锁外完成，不阻塞其他接收线程
+        old = stale = None
+        while True:
+            with self.lock:
+                # 剩余空间不足时切换日志段，始终为结束标记预留一个记录头
+                if self.pos + size + self.RECORD_HEADER.size > self.segment_size:
+                    spare, self.spare = self.spare, None
+                    if spare is not None and spare[0] > self.segment_id:
+                        old = self.switch_segment(*spare)
+                    else:
+                        # 快照期间已切换到序号更大的日志段，回放按序号顺序，序号更小的预备日志段不能再使用
+                        stale = spare
+                if self.pos + size + self.RECORD_HEADER.size <= self.segment_size:
+                    self.mm[self.pos + self.RECORD_HEADER.size : self.pos + size] = data
+                    self.mm[self.pos : self.pos + self.RECORD_HEADER.size] = self.RECORD_HEADER.pack(len(data), zlib.crc32(data))
+                    self.pos += size
+                    self.dirty = True
+                    break
+            # 写入速度超过后台线程补充预备日志段的速度时，在锁外创建后重试
+            if stale is not None:
+                self.discard_segment(stale)
+                stale = None
+            self.prepare_spare()
+        if old is not None:
+            self.close_segment(old)
+
+    def append_node(self, name, node_info, metrics, received, ts):
+        # 新版slave的JSON上报中携带的metrics与单独记录的数值指标重复，不写入日志
+        info = {key: value for key, value in node_info.items() if key != "metrics"}
+        self.append({"n": name, "i": info, "m": metrics, "r": received, "t": ts})
+
+    def flush(self):
+        """将映射内存写回磁盘，防止操作系统崩溃时丢失数据(进程崩溃时页缓存中的数据不会丢失)"""
+        with self.lock:
+            if self.dirty:
+                self.mm.flush()
+                self.dirty = False
+
+    def replay(self, start_id):
+        """按顺序读取从start_id开始的所有日志段中的记录，遇到结束标记或校验失败(写入中途崩溃)时结束该段"""
+        for segment_id in self.segment_ids():
+            if segment_id < start_id:
+                continue
+            with open(self.segment_path(segment_id), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self.RECORD_HEADER.size:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pos = 0
+                    while pos + self.RECORD_HEADER.size <= size:
+                        length, crc = self.RECORD_HEADER.unpack_from(mm, pos)
+                        end = pos + self.RECORD_HEADER.size + length
+                        if length == 0 or end > size:
+                            break
+                        data = mm[pos + self.RECORD_HEADER.size : end]
+                        if zlib.crc32(data) != crc:
+                            print(f"日志段 {segment_id} 在偏移 {pos} 处校验失败，忽略之后的记录")
+                            break
+                        yield json.loads(data)
+                        pos = end
+
+    def write_snapshot(self, header, blobs):
+        """原子地写入快照(先写临时文件再重命名)，成功后删除快照已覆盖的旧日志段"""
+        data = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        tmp_path = os.path.join(self.dir, "snapshot.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self.SNAPSHOT_MAGIC + struct.pack("!I", len(data)) + data)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.dir, "snapshot.bin"))
+        for segment_id in self.segment_ids():
+            if segment_id < header["segment"]:
+                os.remove(self.segment_path(segment_id))
+
+    def load_snapshot(self):
+        """返回 (JSON头部, 映射的快照内存, 数组字节起始偏移)，没有快照时返回None"""
+        path = os.path.join(self.dir, "snapshot.bin")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:8] != self.SNAPSHOT_MAGIC:
+            raise ValueError("快照文件格式错误")
+        (length,) = struct.unpack_from("!I", mm, 8)
+        return json.loads(mm[12 : 12 + length]), mm, 12 + length
+
+
+# ---------- 生成快照：在锁内复制节点和历史数据，在锁外写入磁盘 ----------
+def take_snapshot():
+    # 新日志段的文件在锁外创建，节点数据锁内只切换引用，旧日志段的写回和关闭也在锁外完成，不阻塞接收和渲染
+    prepared = state_store.prepare_roll()
+    with registry.lock:
+        # 在节点数据锁内切换日志段：写入日志发生在更新注册表之后，旧日志段中的记录都已包含在本次复制中
+        segment_id, old_segment = state_store.roll(prepared)
+        records = list(registry.records.items())
+    state_store.close_segment(old_segment)
+    node_list = [[name, {k: v for k, v in record.info.items() if k != "metrics"}, record.metrics, record.received, record.ts] for name, record in records]
+    with history_lock:
+        layout = []
+        blobs = []
+        for name, series in history.items():
+            for key, rings in series.items():
+                layout.append([name, key, [[ring.step, ring.capacity, ring.size] for ring in rings]])
+                for ring in rings:
+                    blobs.extend(ring.export())
+    state_store.write_snapshot({"segment": segment_id, "time": int(time.time()), "nodes": node_list, "history": layout}, blobs)
+    return len(node_list)
+
+
+# ---------- 由持久化的接收时间(epoch秒)推算monotonic接收时间，恢复的节点按停机前的最后上报时间计算离线和过期 ----------
+def restored_seen(received):
+    return time.monotonic() - max(0, time.time() - received)
+
+
+# ---------- 启动时恢复：映射快照并重放之后的日志 ----------
+def restore_state():
+    started = time.monotonic()
+    start_id = 0
+    restored_history = 0
+    snapshot = state_store.load_snapshot()
+    if snapshot is not None:
+        header, mm, offset = snapshot
+        start_id = header["segment"]
+        for name, info, metrics, received, ts in header["nodes"]:
+            registry.store(name, info, metrics, received, ts, restored_seen(received))
+        # 历史数据直接从映射内存复制到预分配数组，环形缓冲区配置变化时跳过不匹配的部分
+        with history_lock:
+            for name, key, ring_layout in header["history"]:
+                rings = []
+                for step, capacity, size in ring_layout:
+                    ring = MetricRing(step, capacity)
+                    offset = ring.load(mm, offset, size)
+                    rings.append(ring)
+                if tuple((r.step, r.capacity) for r in rings) == HISTORY_TIERS:
+                    history.setdefault(name, {})[key] = tuple(rings)
+                    restored_history += 1
+        mm.close()
+
+    # 重放快照之后的日志，恢复最新节点数据和历史数据
+    replayed = 0
+    for record in state_store.replay(start_id):
+        if "d" in record:
+            registry.remove(record["d"])
+            with history_lock:
+                for name in record["d"]:
+                    history.pop(name, None)
+        else:
+            registry.store(record["n"], record["i"], record["m"], record["r"], record["t"], restored_seen(record["r"]))
+            record_history(record["n"], record["m"], record["r"])
+        replayed += 1
+
+    # 新数据写入新的日志段，不追加到可能写到一半的旧日志段
+    with state_store.lock:
+        state_store.open_segment(max(state_store.segment_ids() + [start_id]) + 1)
+    print(f"从 {state_store.dir} 恢复 {len(registry)} 个节点、{restored_history} 条历史序列，重放 {replayed} 条日志，耗时 {time.monotonic() - started:.2f} 秒")
+
+
+# ---------- 后台持久化线程：定期刷盘和生成快照 ----------
+def persist_loop(snapshot_interval, flush_interval=5):
+    last_snapshot = time.monotonic()
     while True:
-        now = datetime.now()
-        # 线程安全地访问nodes字典，找出过期节点
-        with nodes_lock:
-            to_delete = [name for name, info in nodes.items() if _older_than_2h(info.get("timestamp", {}).get("display"), now)]
-            for name in to_delete:
-                del nodes[name]
-            if to_delete:
-                print(f"删除 {len(to_delete)} 个过期节点: {to_delete}")
-        # 每120秒检查一次
-        time.sleep(120)
-
-
-# ---------- UDP服务线程：接收并处理slave节点发送的数据 ----------
-def udp_server(port):
-    # 创建UDP socket并绑定到指定端口
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(("", port))
-    print(f"UDP 服务启动在端口 {port}")
+        time.sleep(flush_interval)
+        try:
+            state_store.prepare_spare()
+            state_store.flush()
+            if time.monotonic() - last_snapshot >= snapshot_interval:
+                last_snapshot = time.monotonic()
+                count = take_snapshot()
+                SNAPSHOT_SECONDS.observe(time.monotonic() - last_snapshot)
+                print(f"已生成快照: {count} 个节点，耗时 {time.monotonic() - last_snapshot:.2f} 秒")
+        except Exception as e:
+            error_log.log("persist", f"持久化失败: {e}")
 
-    # 持续接收数据的主循环
+
+# ---------- 后台清理线程：定期标记离线节点、删除过期节点 ----------
+def cleanup_dead(interval=5):
+    # 只弹出到期的堆条目，没有节点到期时几乎没有开销，因此可以频繁检查
     while True:
-        # 接收UDP数据包，最大16KB
-        data, addr = sock.recvfrom(1024 * 16)
+        time.sleep(interval)
+        started = time.perf_counter()
+        stale, expired, version = registry.sweep()
+        if stale:
+            names = [name for name, _ in stale[:20]]
+            print(f"{len(stale)} 个节点超过 {registry.stale_after:g} 秒未上报: {names}{' ...' if len(stale) > 20 else ''}")
+        if expired:
+            if state_store is not None:
+                state_store.append({"d": expired})
+            print(f"删除 {len(expired)} 个过期节点: {expired}")
+            # 同步删除过期节点的历史数据
+            with history_lock:
+                for name in expired:
+                    history.pop(name, None)
+        if event_hub is not None and (stale or expired):
+            event_hub.publish([(name, record.version, record) for name, record in stale] + [(name, version, None) for name in expired])
+        # 检查长时间未上报的节点，删除节点时恢复其全部告警
+        if alert_engine is not None:
+            alerts = alert_engine.check_silent()
+            if expired:
+                alerts += alert_engine.forget(expired)
+            publish_alerts(alerts)
+        CLEANUP_SECONDS.observe(time.perf_counter() - started)
+
+
+# ---------- 创建UDP socket：多线程时优先使用 SO_REUSEPORT 让内核在多个socket间分发数据包 ----------
+def open_udp_sockets(port, workers, rcvbuf):
+    reuse_port = workers > 1 and hasattr(socket, "SO_REUSEPORT")
+    socks = []
+    for _ in range(workers if reuse_port else 1):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.bind(("", port))
+        socks.append(sock)
+    actual = socks[0].getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if actual < rcvbuf:
+        print(f"警告: UDP 接收缓冲区实际为 {actual} 字节，小于设置的 {rcvbuf} 字节，请调大 net.core.rmem_max")
+    # 不支持 SO_REUSEPORT 时所有线程共享同一个socket
+    return [socks[i % len(socks)] for i in range(workers)]
+
+
+# ---------- 读取内核统计的UDP socket缓冲区溢出丢包数(仅Linux) ----------
+def read_socket_drops(port):
+    drops = 0
+    for path in ("/proc/net/udp", "/proc/net/udp6"):
         try:
-            # 解码JSON数据并提取节点信息
-            message = data.decode("utf-8")
-            node_info = json.loads(message)
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if int(fields[1].rsplit(":", 1)[1], 16) == port:
+                        drops += int(fields[-1])
+        except (OSError, ValueError, IndexError, StopIteration):
+            continue
+    return drops
+
+
+# ---------- 返回接收统计快照 ----------
+def get_ingest_stats():
+    with ingest_stats_lock:
+        stats = dict(ingest_stats)
+    stats["socket_drops"] = read_socket_drops(data_port)
+    stats["fragments_pending"] = len(reassembler.pending)
+    stats["fragments_pending_bytes"] = reassembler.bytes
+    _, records = registry.snapshot()
+    stats["nodes"] = len(records)
+    stats["stale_nodes"] = sum(record.stale for _, record in records)
+    if event_hub is not None:
+        stats["sse_clients"] = len(event_hub.clients)
+        stats["sse_dropped"] = event_hub.dropped
+    return stats
+
+
+# ---------- 以Prometheus文本格式输出接收计数器、状态量和耗时直方图 ----------
+def render_prometheus():
+    stats = get_ingest_stats()
+    with history_lock:
+        series = sum(len(keys) for keys in history.values())
+    lines = []
+
+    def metric(name, kind, help_text, value):
+        lines.extend((f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"))
+
+    # 计数器(包括白名单、100秒去重、解析失败等各类丢弃原因)
+    for key in ingest_stats:
+        metric(f"fml_ingest_{key}_total", "counter", f"数据接收计数: {key}", stats[key])
+    metric("fml_socket_drops_total", "counter", "内核统计的UDP接收缓冲区溢出丢包数", stats["socket_drops"])
+    metric("fml_sse_dropped_total", "counter", "因发送缓冲区超限被断开的订阅连接数", stats.get("sse_dropped", 0))
+    # 状态量
+    metric("fml_nodes", "gauge", "当前节点数", stats["nodes"])
+    metric("fml_stale_nodes", "gauge", "超时未上报(灰色显示)的节点数", stats["stale_nodes"])
+    metric("fml_fragments_pending", "gauge", "等待其余分片的未完成消息数", stats["fragments_pending"])
+    metric("fml_fragments_pending_bytes", "gauge", "未完成消息缓存的分片字节数", stats["fragments_pending_bytes"])
+    metric("fml_sse_clients", "gauge", "实时推送订阅连接数", stats.get("sse_clients", 0))
+    metric("fml_history_series", "gauge", "历史数据序列数", series)
+    metric("fml_data_version", "gauge", "节点数据版本号", registry.version)
+    metric("fml_alerts_firing", "gauge", "当前已触发的告警数", len(alert_engine.firing) if alert_engine is not None else 0)
+    # 耗时直方图
+    for name, (help_text, by_labels) in histograms.items():
+        lines.extend((f"# HELP {name} {help_text}", f"# TYPE {name} histogram"))
+        for labels, hist in by_labels.items():
+            lines.extend(hist.render(name, labels))
+    return "\n".join(lines) + "\n"
+
+
+# ---------- 后台统计线程：定期输出接收计数器 ----------
+def report_ingest_stats(interval=300):
+    last = None
+    while True:
+        time.sleep(interval)
+        stats = get_ingest_stats()
+        if stats != last:
+            print("接收统计: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        last = stats
+
+
+# ---------- 中继模式：把本机收到的节点数据定期批量压缩后转发给上级master ----------
+# 数据报头部与slave的二进制上报相同，魔数为 FMLB，负载为 zlib 压缩的 JSON:
+#   {"nodes": [[节点名, 节点信息, 数值指标, 上报时间epoch秒], ...], "alive": [[节点名, 上报时间epoch秒], ...]}
+# nodes 为上次转发之后变化的节点(增量上报已在中继合并为完整数据)，alive 为期间只有心跳的节点，上级据此刷新存活时间
+BUNDLE_MAGIC = b"FMLB"
+BUNDLE_MAX_INFLATED = 4 * 1024 * 1024  # 解压后的大小上限
+BUNDLE_INFO_KEYS = ("name", "ip", "timestamp", "cpu", "memory", "disk", "gpu")  # 节点信息中页面渲染需要的 {"display": ...} 字段
+
 
-            node_name = node_info["name"]["display"]
-            node_ip = node_info["ip"]["display"]
+# ---------- 将节点数据打包为若干个包裹的数据报列表，单个包裹不超过255个分片 ----------
+def encode_bundles(nodes, alive, mtu):
+    chunk = max(mtu - WIRE_HEADER.size, 64)
+    # 按压缩前大小拆分包裹(压缩后不会比压缩前大太多)，保证分片数不超过上限
+    limit = min(200 * chunk, BUNDLE_MAX_INFLATED // 2)
+    groups = [[]]
+    size = 0
+    for entry in nodes:
+        if groups[-1] and size + len(entry) > limit:
+            groups.append([])
+            size = 0
+        groups[-1].append(entry)
+        size += len(entry) + 1
+    datagrams = []
+    for i, group in enumerate(groups):
+        payload = b'{"nodes":[' + b",".join(group) + b'],"alive":' + json.dumps(alive if i == 0 else []).encode("utf-8") + b"}"
+        payload = zlib.compress(payload, 6)
+        chunks = [payload[j : j + chunk] for j in range(0, len(payload), chunk)]
+        msg_id = random.getrandbits(32)
+        datagrams.extend(WIRE_HEADER.pack(BUNDLE_MAGIC, WIRE_VERSION, WIRE_FLAG_ZLIB, msg_id, j, len(chunks)) + c for j, c in enumerate(chunks))
+    return datagrams
 
-            # 如果设置了白名单则进行过滤检查
-            if white_set and (node_name, node_ip) not in white_set:
+
+# ---------- 解码一个包裹，返回 ([(节点名, IP, 节点信息, 数值指标, 上报时间)], [(节点名, 上报时间)], 被丢弃的条目数) ----------
+def decode_bundle(flags, payload):
+    if flags & WIRE_FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(payload, BUNDLE_MAX_INFLATED)
+        if decompressor.unconsumed_tail:
+            raise ValueError("中继包裹解压后过大")
+    bundle = json.loads(payload)
+    # 逐条校验：节点信息缺少页面渲染所需的 {"display": ...} 字段或指标无法整理的条目被丢弃并计数，不影响同一包裹中的其余节点
+    nodes, alive, rejected = [], [], 0
+    for entry in bundle.get("nodes") or ():
+        try:
+            name, info, metrics, ts = entry
+            if not isinstance(name, str) or not isinstance(info, dict) or not all(isinstance(info.get(key), dict) and "display" in info[key] for key in BUNDLE_INFO_KEYS):
+                raise ValueError("节点信息不完整")
+            nodes.append((name, info["ip"]["display"], info, normalize_metrics(metrics), int(ts)))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            rejected += 1
+    for entry in bundle.get("alive") or ():
+        try:
+            name, ts = entry
+            if not isinstance(name, str):
+                raise ValueError("节点名无效")
+            alive.append((name, int(ts)))
+        except (TypeError, ValueError):
+            rejected += 1
+    return nodes, alive, rejected
+
+
+# ---------- 中继转发线程：按固定节奏转发上次之后变化的节点和有心跳的节点 ----------
+def relay_loop(target, interval, mtu):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    since = 0
+    last_run = time.monotonic()
+    next_run = last_run
+    while True:
+        next_run += interval
+        time.sleep(max(0, next_run - time.monotonic()))
+        started = time.monotonic()
+        try:
+            version, _, changed, _ = registry.changes(since)
+            # 离线节点由上级按自己的接收时间判断，不转发
+            nodes = [
+                json.dumps([name, {k: v for k, v in record.info.items() if k != "metrics"}, record.metrics, record.ts], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                for name, record in changed
+                if not record.stale
+            ]
+            changed_names = {name for name, _ in changed}
+            alive = [[name, record.ts] for name, record in registry.snapshot()[1] if record.seen > last_run and not record.stale and name not in changed_names]
+            since, last_run = version, started
+            if not nodes and not alive:
                 continue
+            datagrams = encode_bundles(nodes, alive, mtu)
+            for datagram in datagrams:
+                sock.sendto(datagram, target)
+            with ingest_stats_lock:
+                ingest_stats["relayed"] += len(nodes)
+                ingest_stats["relay_datagrams"] += len(datagrams)
+        except Exception as e:
+            error_log.log("relay", f"转发到上级失败: {e}")
+
 
-            # 解析并验证时间戳，避免重复数据
-            new_ts_str = node_info["timestamp"]["display"]
-            new_dt = datetime.strptime(new_ts_str, "%Y-%m-%d %H:%M:%S")
-
-            # 线程安全地更新节点信息
-            with nodes_lock:
-                # 获取上次记录的时间戳
-                old_ts_str = nodes.get(node_name, {}).get("timestamp", {}).get("display", "")
-                # 如果100秒内有重复数据则丢弃
-                if old_ts_str:
-                    old_dt = datetime.strptime(old_ts_str, "%Y-%m-%d %H:%M:%S")
-                    if (new_dt - old_dt).total_seconds() <= 100:
+# ---------- UDP服务线程：接收并处理slave节点发送的数据，可多线程并行运行 ----------
+def udp_server(sock, batch_size):
+    dontwait = getattr(socket, "MSG_DONTWAIT", 0)
+
+    # 持续接收数据的主循环
+    while True:
+        # 阻塞等待第一个数据包，然后非阻塞地取出已到达的其余数据包，批量处理以减少加锁次数
+        # 按UDP数据报最大长度接收，避免截断
+        batch = [sock.recvfrom(65535)]
+        if dontwait:
+            try:
+                while len(batch) < batch_size:
+                    batch.append(sock.recvfrom(65535, dontwait))
+            except (BlockingIOError, InterruptedError):
+                pass
+
+        counts = dict.fromkeys(ingest_stats, 0)
+        counts["received"] = len(batch)
+        reports = []
+        bulk = []
+        bulk_alive = []
+        for data, addr in batch:
+            started = time.perf_counter()
+            try:
+                if data[:4] == BUNDLE_MAGIC:
+                    # 下级中继转发的多节点包裹，收齐分片后与其余包裹一起批量写入
+                    message = reassembler.add(data, addr)
+                    if message is None:
+                        counts["incomplete"] += 1
                         continue
+                    nodes, alive, rejected = decode_bundle(*message)
+                    PARSE_SECONDS["bundle"].observe(time.perf_counter() - started)
+                    counts["bundles"] += 1
+                    if rejected:
+                        counts["dropped_error"] += rejected
+                        error_log.log("bundle", f"中继包裹中 {rejected} 个条目无效，已丢弃 (来自 {addr[0]})")
+                    counts["parsed"] += len(nodes)
+                    for node_name, node_ip, node_info, metrics, ts in nodes:
+                        if white_set and (node_name, node_ip) not in white_set:
+                            counts["dropped_whitelist"] += 1
+                            continue
+                        bulk.append((node_name, node_info, metrics, ts))
+                    bulk_alive.extend(alive)
+                    continue
 
-                # 更新节点信息到内存
-                nodes[node_name] = node_info
+                # 解码数据(JSON或二进制)并提取节点信息、数值指标和上报时间，均在锁外完成
+                parsed = parse_packet(data, addr)
+                PARSE_SECONDS["binary" if data[:4] == WIRE_MAGIC else "json"].observe(time.perf_counter() - started)
+                if parsed is None:
+                    counts["incomplete"] += 1
+                    continue
+                counts["parsed"] += 1
 
-        except Exception as e:
-            print(f"处理数据失败: {e}")
+                # 如果设置了白名单则进行过滤检查
+                if white_set and (parsed[0], parsed[1]) not in white_set:
+                    counts["dropped_whitelist"] += 1
+                    continue
+                reports.append((addr, parsed))
+            except Exception as e:
+                counts["dropped_error"] += 1
+                error_log.log(type(e).__name__, f"处理数据失败: {e} (来自 {addr[0]})")
 
+        # 逐条写入节点注册表，每条只短暂持有注册表的锁
+        started = time.perf_counter()
+        received = int(time.time())
+        stored = []
+        alive = []
+        events = []
+        resync = []
+        for addr, (node_name, node_ip, ts, node_info, metrics, seq, raw) in reports:
+            # 单条上报处理出错时只丢弃该条，不影响同批其余上报和接收线程
+            try:
+                if seq is None:
+                    # 不带序号的上报：旧版slave的JSON上报如果100秒内有重复数据则丢弃(使用epoch整数比较)，
+                    # 新版slave(二进制或携带metrics的JSON)可能以更短的间隔上报，只丢弃上报时间相同的重复数据
+                    old = registry.get(node_name)
+                    legacy = raw is None and "metrics" not in node_info
+                    if old is not None and (ts - old.ts <= 100 if legacy else ts == old.ts):
+                        counts["dropped_duplicate"] += 1
+                        continue
+                else:
+                    # 带序号的上报：按序号去重，合并增量，序号缺失时请求重同步
+                    action, node_info, metrics, need_resync = apply_sequenced(node_name, node_ip, ts, node_info, metrics, seq, raw)
+                    if need_resync:
+                        resync.append((node_name, addr, seq[0]))
+                    if action == "duplicate":
+                        counts["dropped_duplicate"] += 1
+                    if action == "heartbeat":
+                        # 心跳只刷新存活时间，不递增数据版本号，避免重新渲染；离线节点恢复时才需要推送
+                        counts["heartbeats"] += 1
+                        alive.append(node_name)
+                        record = registry.touch(node_name, ts, received)
+                        if record is not None:
+                            events.append((node_name, record.version, record))
+                    if action != "store":
+                        continue
+
+                # 更新节点信息到内存并递增数据版本号，启用持久化时追加到日志
+                record = registry.store(node_name, node_info, metrics, received, ts)
+                stored.append((node_name, metrics))
+                events.append((node_name, record.version, record))
+                if state_store is not None:
+                    state_store.append_node(node_name, node_info, metrics, received, ts)
+            except Exception as e:
+                counts["dropped_error"] += 1
+                error_log.log(type(e).__name__, f"写入节点 {node_name} 失败: {e} (来自 {addr[0]})")
+
+        # 中继包裹中的节点已在中继去重，一次加锁批量写入
+        if bulk:
+            bulk_stored = registry.store_many(bulk, received)
+            counts["dropped_error"] += len(bulk) - len(bulk_stored)
+            for node_name, record in bulk_stored:
+                stored.append((node_name, record.metrics))
+                events.append((node_name, record.version, record))
+                if state_store is not None:
+                    try:
+                        state_store.append_node(node_name, record.info, record.metrics, received, record.ts)
+                    except Exception as e:
+                        error_log.log(type(e).__name__, f"写入节点 {node_name} 的日志失败: {e}")
+        if bulk_alive:
+            counts["heartbeats"] += len(bulk_alive)
+            alive.extend(node_name for node_name, _ in bulk_alive)
+            events.extend((node_name, record.version, record) for node_name, record in registry.touch_many(bulk_alive, received))
+        counts["stored"] = len(stored)
+
+        # 推送给实时订阅者(序列化和发送都在推送线程完成)
+        if events and event_hub is not None:
+            event_hub.publish(events)
+
+        # 只对本批上报的节点判断告警规则，心跳只影响 silent 规则
+        if alert_engine is not None and (stored or alive):
+            seen = time.monotonic()
+            publish_alerts(alert_engine.observe_many([(node_name, metrics, seen) for node_name, metrics in stored] + [(node_name, None, seen) for node_name in alive]))
+
+        # 在锁外发送重同步请求，同一节点10秒内最多请求一次
+        now = time.monotonic()
+        for node_name, addr, session in resync:
+            last = registry.resync_requested.get(node_name)
+            if last is not None and now - last < 10:
+                continue
+            registry.resync_requested[node_name] = now
+            counts["resync_requests"] += 1
+            try:
+                sock.sendto(RESYNC_MAGIC + struct.pack("!I", session), addr)
+            except OSError as e:
+                error_log.log("resync", f"发送重同步请求失败: {e}")
+
+        # 数值指标写入历史数据(使用master接收时间)
+        for node_name, metrics in stored:
+            try:
+                record_history(node_name, metrics, received)
+            except Exception as e:
+                error_log.log(type(e).__name__, f"写入节点 {node_name} 的历史数据失败: {e}")
+        INGEST_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+        with ingest_stats_lock:
+            for key, value in counts.items():
+                ingest_stats[key] += value
 
-# ---------- HTTP服务处理器：生成Web仪表盘页面 ----------
-class DashboardHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        # 设置HTTP响应头
-        self.send_response(200)
-        self.send_header("Content-type", "text/html; charset=utf-8")
-        self.end_headers()
 
-        # 生成HTML页面的头部和样式
-        html = """<html lang=zh-CN translate=no>
+# ---------- 仪表盘页面模板 ----------
+PAGE_HEAD = """<html lang=zh-CN translate=no>
 <head>
 <title>FML服务器仪表盘</title>
 <meta charset="utf-8">
@@ -158,34 +1871,628 @@ class DashboardHandler(http.server.SimpleHTTPRequestHandler):
     /* 斑马纹+悬浮高亮 */
     tbody tr:nth-child(even){background:var(--stripe);}
     tbody tr:hover{background:rgba(13,110,253,.06);}
+    /* 用户资源占用表 */
+    h2{text-align:center;margin:2.5rem 0 1rem;font-weight:600;}
+    /* 超时未上报的节点 */
+    tr.stale{opacity:.45;filter:grayscale(1);}
+    /* 当前告警表 */
+    #alerts th{color:#e03131;}
 </style>
 </head>
 <body>
 <h1>FML服务器仪表盘</h1>
-<table>
+"""
+NODES_HEAD = """<table id=nodes>
 <tr><th>节点名称</th><th>CPU/内存/硬盘</th><th>GPU</th></tr>\n"""
+ALERTS_HEAD = "<table>\n<tr><th>告警</th><th>节点</th><th>对象</th><th>当前值</th><th>持续时间</th></tr>\n"
+ALERTS_RECENT_LIMIT = 20  # 页面上最多显示的最近触发/恢复记录数
+ALERTS_RECENT_HEAD = "<h2>最近告警记录</h2>\n<table>\n<tr><th>时间</th><th>状态</th><th>告警</th><th>节点</th><th>对象</th><th>值</th></tr>\n"
+USERS_TABLE_LIMIT = 20  # 页面上最多显示的用户数
+USERS_HEAD = "<h2>用户资源占用</h2>\n<table>\n<tr><th>用户</th><th>显存(占比)</th><th>CPU核(占比)</th><th>内存(占比)</th><th>节点</th><th>占用时间</th></tr>\n"
+# 页面脚本：订阅 /events，按节点名原地替换、追加或删除表格行，页面版本过旧时重新加载
+PAGE_SCRIPT = """<script>
+(function(){
+    if(!window.EventSource)return;
+    var es=new EventSource("/events?since=%s");
+    function row(name){return document.getElementById("node-"+name);}
+    es.addEventListener("node",function(e){
+        var d=JSON.parse(e.data),r=row(d.name);
+        if(!r){r=document.createElement("tr");r.id="node-"+d.name;document.querySelector("#nodes tbody").appendChild(r);}
+        r.innerHTML=d.row;r.className=d.stale?"stale":"";
+    });
+    es.addEventListener("remove",function(e){var r=row(JSON.parse(e.data).name);if(r)r.remove();});
+    es.addEventListener("alerts",function(e){document.getElementById("alerts").innerHTML=JSON.parse(e.data).html;});
+    es.addEventListener("reload",function(){es.close();location.reload();});
+})();
+</script>
+"""
+PAGE_TAIL = '</table>\n<p><a href="https://github.com/yt2nj/fml_server_dashboard" style="color: var(--accent);">详情请见GitHub.</a></p>\n'
 
-        # 线程安全地读取节点数据并生成表格行
-        with nodes_lock:
-            for name, info in nodes.items():
-                html += f"<tr>"
-                html += f'<td>{info.get("name").get("display")}<br>[{info.get("ip").get("display")}]<br>({info.get("timestamp").get("display")})</td>'
-                html += f'<td>{info.get("cpu").get("display")}<br>{info.get("memory").get("display")}<br>{info.get("disk").get("display")}</td>'
-                html += f'<td>{info.get("gpu").get("display")}</td>'
-                html += f"</tr>\n"
-
-        # 生成页面尾部
-        html += "</table>\n"
-        html += (
-            '<p><a href="https://github.com/yt2nj/fml_server_dashboard" style="color: var(--accent);">详情请见GitHub.</a></p>\n'
-        )
-        html += "</body>\n</html>"
-        # 发送HTML内容
-        self.wfile.write(html.encode("utf-8"))
+
+# ---------- 渲染单个节点的表格单元格，页面和实时推送共用 ----------
+def render_node_cells(info):
+    return (
+        f'<td>{info.get("name").get("display")}<br>[{info.get("ip").get("display")}]<br>({info.get("timestamp").get("display")})</td>'
+        f'<td>{info.get("cpu").get("display")}<br>{info.get("memory").get("display")}<br>{info.get("disk").get("display")}</td>'
+        f'<td>{info.get("gpu").get("display")}</td>'
+    )
+
+
+# ---------- 渲染仪表盘页面，返回缓存元组 (版本号, ETag, HTML字节, gzip字节) ----------
+def render_dashboard():
+    # 节点记录只会整体替换不会原地修改，复制记录列表后即可在锁外渲染
+    version, records = registry.snapshot()
+    metrics_list = [(name, record.metrics) for name, record in records]
+
+    # 使用列表拼接生成表格行，避免重复的字符串相加；离线节点灰色显示
+    parts = [PAGE_HEAD, f"<div id=alerts>{render_alerts()}</div>\n", NODES_HEAD]
+    for name, record in records:
+        stale = " class=stale" if record.stale else ""
+        parts.append(f'<tr id="node-{html.escape(name)}"{stale}>{render_node_cells(record.info)}</tr>\n')
+    users = aggregate_users(metrics_list, time.time())
+    if users:
+        parts.append("</table>\n")
+        parts.append(USERS_HEAD)
+        for u in users[:USERS_TABLE_LIMIT]:
+            parts.append(
+                f"<tr><td>{html.escape(u['user'])}</td><td>{u['gpu_mem'] / 1024:.1f}GB ({u['gpu_mem_share']:.1f}%)</td>"
+                f"<td>{u['cpu']:.1f} ({u['cpu_share']:.1f}%)</td><td>{u['rss']:.1f}GB ({u['rss_share']:.1f}%)</td>"
+                f"<td>{len(u['nodes'])}</td><td>{format_duration(u['duration'])}</td></tr>\n"
+            )
+    parts.append(PAGE_TAIL)
+    parts.append(PAGE_SCRIPT % f"{boot_id}-{version}")
+    parts.append("</body>\n</html>")
+    body = "".join(parts).encode("utf-8")
+    return (version, f'"{boot_id}-{version}"', body, gzip.compress(body, 6))
+
+
+# ---------- 渲染当前告警表，没有告警时为空，页面和实时推送共用 ----------
+def render_alerts():
+    if alert_engine is None:
+        return ""
+    alerts = alert_engine.active()
+    recent = alert_engine.recent_events()[-ALERTS_RECENT_LIMIT:]
+    now = time.time()
+    parts = []
+    if alerts:
+        parts.append(ALERTS_HEAD)
+        for alert in alerts:
+            value = alert["value"]
+            parts.append(
+                f"<tr><td>{html.escape(alert['rule'])}<br>({html.escape(alert['when'])})</td><td>{html.escape(alert['node'])}</td>"
+                f"<td>{html.escape(alert['target']) or '-'}</td><td>{'-' if value is None else f'{value:.4g}'}</td><td>{format_duration(now - alert['since'])}</td></tr>\n"
+            )
+        parts.append("</table>\n")
+    # 最近的触发和恢复记录，最新的在前
+    if recent:
+        parts.append(ALERTS_RECENT_HEAD)
+        for event in reversed(recent):
+            value = event["value"]
+            state = "触发" if event["event"] == "firing" else "恢复"
+            parts.append(
+                f"<tr><td>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['time']))}</td><td>{state}</td>"
+                f"<td>{html.escape(event['rule'])}</td><td>{html.escape(event['node'])}</td><td>{html.escape(event['target']) or '-'}</td>"
+                f"<td>{'-' if value is None else f'{value:.4g}'}</td></tr>\n"
+            )
+        parts.append("</table>\n")
+    return "".join(parts)
+
+
+# ---------- 告警事件的统一出口：输出日志、交给通知线程，刷新页面缓存并推送给订阅者 ----------
+def publish_alerts(events):
+    if not events:
+        return
+    for event in events[:20]:
+        kind = "告警触发" if event["event"] == "firing" else "告警恢复"
+        target = f" {event['target']}" if event["target"] else ""
+        print(f"{kind}: {event['rule']} ({event['when']}) 节点 {event['node']}{target} 当前值 {event['value']}")
+    if len(events) > 20:
+        print(f"... 另有 {len(events) - 20} 条告警变化")
+    alert_notifier.put(events)
+    registry.bump()
+    if event_hub is not None:
+        event_hub.notify(f"event: alerts\ndata: {json.dumps({'html': render_alerts()}, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+
+# ---------- 将秒数格式化为 "x天x小时" / "x小时x分" / "x分" ----------
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    minutes = int(seconds) // 60
+    if minutes >= 24 * 60:
+        return f"{minutes // 1440}天{minutes % 1440 // 60}小时"
+    if minutes >= 60:
+        return f"{minutes // 60}小时{minutes % 60}分"
+    return f"{minutes}分"
+
+
+# ---------- 汇总全集群的用户资源占用，按显存、CPU、内存排序 ----------
+def aggregate_users(metrics_list, now):
+    """
+    输入 [(节点名, 数值指标), ...]，输出每个用户的显存(MB)、CPU核数、内存(GB)合计及其占全集群总量的百分比，
+    以及占用资源的节点列表和持续时间(从最早的活跃进程启动时算起)
+    """
+    totals = {"gpu_mem": 0.0, "cpu": 0.0, "rss": 0.0}
+    users = {}
+    for name, metrics in metrics_list:
+        totals["gpu_mem"] += sum(gpu["mem_total"] or 0 for gpu in metrics["gpus"])
+        totals["cpu"] += metrics["cpu"].get("count") or 0
+        totals["rss"] += metrics["memory"].get("total") or 0
+        for u in metrics.get("users", []):
+            agg = users.setdefault(u["user"], {"user": u["user"], "gpu_mem": 0.0, "cpu": 0.0, "rss": 0.0, "nodes": [], "since": None})
+            for key in ("gpu_mem", "cpu", "rss"):
+                agg[key] += u[key]
+            agg["nodes"].append(name)
+            if u["since"] is not None:
+                agg["since"] = u["since"] if agg["since"] is None else min(agg["since"], u["since"])
+    result = sorted(users.values(), key=lambda u: (u["gpu_mem"], u["cpu"], u["rss"]), reverse=True)
+    for u in result:
+        for key in ("gpu_mem", "cpu", "rss"):
+            u[f"{key}_share"] = round(u[key] / totals[key] * 100, 2) if totals[key] else 0.0
+        u["duration"] = max(0, int(now - u["since"])) if u["since"] is not None else None
+    return result
+
+
+# ---------- 生成单个节点的结构化数据(仅含类型化数值字段) ----------
+def node_to_json(name, record):
+    info = record.info
+    return {
+        "name": name,
+        "ip": info.get("ip", {}).get("display"),
+        "timestamp": info.get("timestamp", {}).get("display"),
+        "received": record.received,
+        "version": record.version,
+        "stale": record.stale,
+        **record.metrics,
+    }
+
+
+# ---------- 生成节点JSON数据，since不为None时只返回该版本之后变化的节点 ----------
+def render_nodes_json(since=None):
+    version, full, snapshot, removed = registry.changes(since)
+    # boot用于客户端识别master重启(重启后版本号从0重新开始，需丢弃本地状态)
+    result = {
+        "boot": boot_id,
+        "version": version,
+        "full": full,
+        "nodes": {name: node_to_json(name, record) for name, record in snapshot},
+        "removed": removed,
+    }
+    return version, json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+
+# ---------- 全量节点JSON，与页面一样按版本缓存 ----------
+def render_nodes_api():
+    version, body = render_nodes_json()
+    return (version, f'"{boot_id}-{version}"', body, gzip.compress(body, 6))
+
+
+# ---------- 获取当前版本的响应缓存，版本变化时重新渲染 ----------
+def get_cached(key, render):
+    cache = render_caches.get(key)
+    if cache is not None and cache[0] == registry.version:
+        return cache
+    # 同一时间只允许一个线程渲染，其余线程等待后直接复用结果
+    with render_lock:
+        cache = render_caches.get(key)
+        if cache is None or cache[0] != registry.version:
+            started = time.perf_counter()
+            cache = render_caches[key] = render()
+            RENDER_SECONDS[key].observe(time.perf_counter() - started)
+        return cache
+
+
+# ---------- 实时推送(SSE)：单个线程通过 selectors 管理所有订阅连接 ----------
+# HTTP线程只发送响应头，随后把socket交给推送线程，空闲的订阅者既不占用线程也不等待节点数据锁
+# 每个事件只序列化一次，追加到各连接的发送缓冲区；缓冲区超过上限的慢客户端直接断开，内存占用有界
+class EventHub:
+    PING_INTERVAL = 15  # 心跳注释行的发送间隔秒数，用于保持连接并及时发现断开的客户端
+
+    def __init__(self, max_clients, max_buffer):
+        self.max_clients = max_clients
+        self.max_buffer = max_buffer
+        self.selector = selectors.DefaultSelector()
+        self.clients = {}  # socket -> [发送缓冲区, 已推送到的版本号, 是否在等待可写]
+        self.joining = []  # 等待推送线程接管的新连接 (socket, 起始版本号)
+        self.pending = {}  # 节点名 -> 待推送的事件，同一节点只保留最新的一次变化
+        self.notice = None  # 待推送的不带id的通知(告警表)，只保留最新一条
+        self.lock = threading.Lock()
+        self.dropped = 0  # 因发送缓冲区超限被断开的连接数
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+    def full(self):
+        return len(self.clients) + len(self.joining) >= self.max_clients
+
+    def wake(self):
+        try:
+            self.wake_w.send(b"\0")
+        except OSError:
+            pass  # 唤醒缓冲区已满说明推送线程尚未处理，无需重复唤醒
+
+    # 由HTTP线程调用，since为None时只推送之后的变化，否则先补发该版本之后的变化
+    def join(self, sock, since):
+        with self.lock:
+            self.joining.append((sock, since))
+        self.wake()
+
+    # 由接收线程和清理线程调用，events 为 [(节点名, 版本号, 节点记录)]，节点记录为None表示已删除
+    def publish(self, events):
+        if not self.clients and not self.joining:
+            return
+        with self.lock:
+            for event in events:
+                old = self.pending.get(event[0])
+                if old is None or old[1] < event[1]:
+                    self.pending[event[0]] = event
+        self.wake()
+
+    # 推送与节点版本无关的通知，不带id，不影响断线重连时的补发位置
+    def notify(self, data):
+        if not self.clients:
+            return
+        with self.lock:
+            self.notice = data
+        self.wake()
+
+    def run(self):
+        next_ping = time.monotonic() + self.PING_INTERVAL
+        while True:
+            for key, mask in self.selector.select(max(0, next_ping - time.monotonic())):
+                sock = key.fileobj
+                if sock is self.wake_r:
+                    try:
+                        while sock.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                if mask & selectors.EVENT_READ:
+                    # 订阅者不会再发送数据，可读通常意味着连接已关闭
+                    try:
+                        if not sock.recv(4096):
+                            self.drop(sock)
+                            continue
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        self.drop(sock)
+                        continue
+                if mask & selectors.EVENT_WRITE:
+                    self.flush(sock)
+
+            with self.lock:
+                joining, self.joining = self.joining, []
+                pending, self.pending = self.pending, {}
+                notice, self.notice = self.notice, None
+            # 先接管新连接再广播：补发数据之前已取出的事件会按版本号过滤，不会重复或倒序
+            for sock, since in joining:
+                self.accept(sock, since)
+            if pending:
+                self.broadcast(sorted(pending.values(), key=lambda event: event[1]))
+            if notice is not None:
+                for sock, client in list(self.clients.items()):
+                    self.send(sock, client, notice)
+            if time.monotonic() >= next_ping:
+                next_ping = time.monotonic() + self.PING_INTERVAL
+                for sock, client in list(self.clients.items()):
+                    self.send(sock, client, b": ping\n\n")
+
+    def accept(self, sock, since):
+        try:
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+        except (OSError, ValueError):
+            sock.close()
+            return
+        parts = [b"retry: 5000\n\n"]
+        if since is None:
+            version = registry.version
+        else:
+            version, full, snapshot, removed = registry.changes(since)
+            if not full:
+                catchup = []
+                size = len(parts[0])
+                events = [(name, record.version, record) for name, record in snapshot] + [(name, version, None) for name in removed]
+                for event in events:
+                    data = encode_event(*event)
+                    size += len(data)
+                    # 补发的数据超过发送缓冲区上限时改为重新加载，否则该连接在收到任何事件之前就会被断开，重连后又会重复同样的补发
+                    if size > self.max_buffer:
+                        full = True
+                        break
+                    catchup.append(data)
+            if full:
+                # 页面版本过旧、master已重启或变化过多，无法增量补发，通知页面重新加载
+                parts.append(b"event: reload\ndata: {}\n\n")
+            else:
+                parts.extend(catchup)
+        client = self.clients[sock] = [bytearray(), version, False]
+        self.send(sock, client, b"".join(parts))
+
+    def broadcast(self, events):
+        started = time.perf_counter()
+        encoded = [(event[1], encode_event(*event)) for event in events]
+        lowest, latest = encoded[0][0], encoded[-1][0]
+        chunk = b"".join(data for _, data in encoded)
+        for sock, client in list(self.clients.items()):
+            if client[1] >= latest:
+                continue
+            # 通常所有订阅者的版本都低于本批事件，直接复用拼接好的数据
+            data = chunk if client[1] < lowest else b"".join(data for version, data in encoded if version > client[1])
+            client[1] = latest
+            self.send(sock, client, data)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+
+    def send(self, sock, client, data):
+        if len(client[0]) + len(data) > self.max_buffer:
+            self.dropped += 1
+            self.drop(sock)
+            return
+        client[0] += data
+        self.flush(sock)
+
+    def flush(self, sock):
+        client = self.clients.get(sock)
+        if client is None:
+            return
+        buf = client[0]
+        try:
+            del buf[:sock.send(buf)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(sock)
+            return
+        # 仅在还有未发送的数据时关注可写事件
+        waiting = bool(buf)
+        if waiting != client[2]:
+            client[2] = waiting
+            self.selector.modify(sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if waiting else 0))
+
+    def drop(self, sock):
+        if self.clients.pop(sock, None) is not None:
+            self.selector.unregister(sock)
+        sock.close()
+
+
+# ---------- 序列化一条SSE事件，id为 "<启动标识>-<版本号>"，断线重连时浏览器会通过 Last-Event-ID 带回 ----------
+def encode_event(name, version, record):
+    if record is None:
+        kind, data = "remove", {"name": name}
+    else:
+        kind, data = "node", {"name": name, "row": render_node_cells(record.info), "stale": record.stale}
+    return f"id: {boot_id}-{version}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+# ---------- 解析事件id，返回版本号；为空时返回None，来自上次启动或格式错误时返回-1(需要全量重新加载) ----------
+def parse_event_id(text):
+    if not text:
+        return None
+    boot, _, version = text.rpartition("-")
+    if boot != boot_id or not version.isdigit():
+        return -1
+    return int(version)
+
+
+# ---------- HTTP服务处理器：生成Web仪表盘页面 ----------
+class DashboardHandler(http.server.SimpleHTTPRequestHandler):
+    # 使用HTTP/1.1以支持keep-alive，所有响应都必须带Content-Length
+    protocol_version = "HTTP/1.1"
+    # 单个连接的读写超时，避免慢客户端长期占用线程(在main中按参数覆盖)
+    timeout = 15
+    # 等待下一个请求(包括新连接的第一个请求)的空闲超时，比读写超时短，空闲的keep-alive连接不会长期占用线程池
+    idle_timeout = 3
+
+    def handle(self):
+        while True:
+            # peek在缓冲区已有数据(如流水线请求)时直接返回，否则最多等待idle_timeout，连接关闭时返回空
+            self.connection.settimeout(self.idle_timeout)
+            try:
+                if not self.rfile.peek(1):
+                    return
+            except OSError:
+                return
+            self.connection.settimeout(self.timeout)
+            self.close_connection = True
+            self.handle_one_request()
+            if self.close_connection:
+                return
+
+    # 发送JSON格式的响应，较大的响应在客户端支持时使用gzip压缩
+    def send_json(self, obj, status=200):
+        body = obj if isinstance(obj, bytes) else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        use_gzip = len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", "")
+        if use_gzip:
+            body = gzip.compress(body, 6)
+        self.send_response(status)
+        self.send_header("Content-type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    # 节点数据接口: /api/nodes 返回全量, /api/nodes?since=<version> 只返回之后变化的节点和已删除的节点名
+    def send_nodes(self, query):
+        since = query.get("since", [""])[0]
+        if not since:
+            _, etag, body, body_gz = get_cached("nodes", render_nodes_api)
+            return self.send_cached(etag, body, body_gz, "application/json; charset=utf-8")
+        try:
+            since = int(since)
+        except ValueError:
+            return self.send_json({"error": "since 必须为整数"}, 400)
+        return self.send_json(render_nodes_json(since)[1])
+
+    # 发送缓存的响应体，支持 If-None-Match 304 与 gzip 压缩
+    def send_cached(self, etag, body, body_gz, content_type):
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        payload = body_gz if use_gzip else body
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # 实时推送接口: /events?since=<事件id>，推送节点变化(event: node/remove)，断线重连时优先使用 Last-Event-ID
+    def send_events(self, query):
+        if event_hub.full():
+            return self.send_json({"error": "订阅连接数已达上限"}, 503)
+        since = parse_event_id(self.headers.get("Last-Event-ID") or query.get("since", [""])[0])
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        # 之后的数据由推送线程发送，当前线程立即返回线程池
+        self.server.detach(self.request)
+        event_hub.join(self.request, since)
+
+    # 历史数据接口: /api/history?node=X&metric=gpu3.util&step=600&since=epoch
+    # 不带metric参数时返回该节点的所有指标序列名
+    def send_history(self, query):
+        node = query.get("node", [""])[0]
+        key = query.get("metric", [""])[0]
+        try:
+            step = int(query.get("step", ["0"])[0])
+            since = int(query.get("since", ["0"])[0])
+        except ValueError:
+            return self.send_json({"error": "step/since 必须为整数"}, 400)
+        if not key:
+            with history_lock:
+                keys = sorted(history.get(node, {}))
+            return self.send_json({"node": node, "metrics": keys, "steps": [step for step, _ in HISTORY_TIERS]})
+        points = query_history(node, key, step, since)
+        if points is None:
+            return self.send_json({"error": "节点、指标或聚合步长不存在"}, 404)
+        return self.send_json({"node": node, "metric": key, "step": step, "points": [[t, round(lo, 2), round(hi, 2), round(avg, 2)] for t, lo, hi, avg in points]})
+
+    # 空闲GPU查询: /api/free_gpus?min_mem_gb=20&max_util=10&min_gpus=1&limit=100
+    # 只包含在线节点，按空闲显存降序、利用率升序排列；min_gpus>1 时只返回至少有这么多块符合条件GPU的节点
+    def send_free_gpus(self, query):
+        try:
+            min_mem_gb = float(query.get("min_mem_gb", ["0"])[0])
+            max_util = float(query.get("max_util", ["100"])[0])
+            min_gpus = int(query.get("min_gpus", ["1"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            # nan/inf 无法参与索引的有序比较，按非法参数处理
+            if not (math.isfinite(min_mem_gb) and math.isfinite(max_util)):
+                raise ValueError
+        except ValueError:
+            return self.send_json({"error": "min_mem_gb/max_util 必须为有限数值, min_gpus/limit 必须为整数"}, 400)
+        version = registry.version
+        matched = registry.free_gpus(min_mem_gb * 1024, max_util)
+        if min_gpus > 1:
+            counts = {}
+            for key in matched:
+                counts[key[2]] = counts.get(key[2], 0) + 1
+            matched = [key for key in matched if counts[key[2]] >= min_gpus]
+        gpus = [
+            {"node": name, "gpu": index, "mem_free": round(-neg_free, 1), "mem_total": total, "util": util}
+            for neg_free, util, name, index, total in matched[: max(limit, 0)]
+        ]
+        return self.send_json({"version": version, "count": len(matched), "gpus": gpus})
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        try:
+            self.route(url)
+        finally:
+            HTTP_SECONDS[url.path if url.path in HTTP_SECONDS else "/"].observe(time.perf_counter() - started)
+
+    def route(self, url):
+        # 根据路径分发请求
+        if url.path == "/api/history":
+            return self.send_history(parse_qs(url.query))
+        if url.path == "/api/nodes":
+            return self.send_nodes(parse_qs(url.query))
+        if url.path == "/api/users":
+            metrics_list = [(name, record.metrics) for name, record in registry.snapshot()[1]]
+            return self.send_json(aggregate_users(metrics_list, time.time()))
+        if url.path == "/api/free_gpus":
+            return self.send_free_gpus(parse_qs(url.query))
+        if url.path == "/api/alerts":
+            if alert_engine is None:
+                return self.send_json({"active": [], "recent": []})
+            return self.send_json({"active": alert_engine.active(), "recent": alert_engine.recent_events()})
+        if url.path == "/events":
+            return self.send_events(parse_qs(url.query))
+        if url.path == "/api/stats":
+            return self.send_json(get_ingest_stats())
+        if url.path == "/metrics":
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # 其余路径返回仪表盘页面(按数据版本缓存, 支持ETag和gzip)
+        _, etag, body, body_gz = get_cached("html", render_dashboard)
+        self.send_cached(etag, body, body_gz, "text/html; charset=utf-8")
+
+
+# ---------- 并发HTTP服务器：有界线程池 + 连接数上限 ----------
+class PooledHTTPServer(http.server.HTTPServer):
+    allow_reuse_address = True
+    request_queue_size = 128  # listen backlog，默认的5在突发连接时会丢弃SYN，客户端要等重传才能连上
+
+    def __init__(self, server_address, handler_class, max_workers, max_conns):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http")
+        # 连接槽位：包括正在处理和在线程池中排队的连接
+        self.conn_slots = threading.BoundedSemaphore(max_conns)
+        self.detached = set()  # 已交给其他线程管理的连接(如SSE订阅)，请求处理结束后不关闭
+
+    def process_request(self, request, client_address):
+        # 超过连接上限时直接关闭新连接，保护已有连接不被拖慢
+        if not self.conn_slots.acquire(blocking=False):
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.conn_slots.release()
+
+    def detach(self, request):
+        self.detached.add(request)
+
+    def shutdown_request(self, request):
+        if request in self.detached:
+            self.detached.discard(request)
+            return
+        super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
 
 
 # ---------- 主程序入口：启动所有服务线程 ----------
 def main():
+    global data_port, state_store, event_hub, alert_engine, alert_notifier
     # 解析命令行参数
     args = parse_args()
     data_port = args.data_port
@@ -199,13 +2506,50 @@ def main():
     else:
         print("白名单未启用（允许所有节点）")
 
-    # 启动后台线程：清理过期节点和UDP数据接收
+    # 节点离线/过期阈值(按master接收时间计算)
+    registry.stale_after = args.stale_after
+    registry.expire_after = args.expire_after
+
+    # 启用持久化时先恢复上次的状态，再开始接收数据
+    if args.data_dir:
+        state_store = StateStore(args.data_dir, args.segment_mb * 1024 * 1024)
+        restore_state()
+        threading.Thread(target=persist_loop, args=(args.snapshot_interval,), daemon=True).start()
+
+    # 加载告警规则，恢复的节点从恢复的接收时间开始计算 silent 规则
+    if args.alert_rules:
+        try:
+            alert_engine, config = AlertEngine.load(args.alert_rules)
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"加载告警规则失败: {e}")
+        alert_notifier = AlertNotifier(config.get("log_file"), config.get("command"))
+        threading.Thread(target=alert_notifier.run, daemon=True).start()
+        alert_engine.observe_many([(name, None, record.seen) for name, record in registry.snapshot()[1]])
+        print(f"告警规则已加载: {', '.join(rule.name for rule in alert_engine.rules)}")
+
+    # 启动后台线程：标记离线和清理过期节点、接收统计和UDP数据接收
     threading.Thread(target=cleanup_dead, daemon=True).start()
-    threading.Thread(target=udp_server, args=(data_port,), daemon=True).start()
+    threading.Thread(target=report_ingest_stats, daemon=True).start()
+    for sock in open_udp_sockets(data_port, args.udp_workers, args.udp_rcvbuf):
+        threading.Thread(target=udp_server, args=(sock, args.udp_batch), daemon=True).start()
+    print(f"UDP 服务启动在端口 {data_port} (接收线程数 {args.udp_workers})")
+
+    # 中继模式：定期把节点数据批量转发给上级master
+    if args.relay_to:
+        host, _, port = args.relay_to.rpartition(":")
+        target = (socket.gethostbyname(host), int(port))
+        threading.Thread(target=relay_loop, args=(target, args.relay_interval, args.relay_mtu), daemon=True).start()
+        print(f"中继模式: 每 {args.relay_interval:g} 秒转发到 {host}:{port}")
+
+    # 启动实时推送线程
+    event_hub = EventHub(args.sse_max_clients, args.sse_buffer_kb * 1024)
+    threading.Thread(target=event_hub.run, daemon=True).start()
 
-    # 启动HTTP服务器提供Web仪表盘
-    with socketserver.TCPServer(("", web_port), DashboardHandler) as httpd:
-        print(f"HTTP 服务启动在端口 {web_port}")
+    # 启动并发HTTP服务器提供Web仪表盘
+    DashboardHandler.timeout = args.http_timeout
+    DashboardHandler.idle_timeout = args.http_idle_timeout
+    with PooledHTTPServer(("", web_port), DashboardHandler, args.http_workers, args.http_max_conns) as httpd:
+        print(f"HTTP 服务启动在端口 {web_port} (线程数 {args.http_workers}, 连接上限 {args.http_max_conns})")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -1,5 +1,5 @@
 # 启动命令示例：python fml_server_dashboard_slave.py --name DELL-G3 --master 127.0.0.1:9901
-# 功能：收集本机系统信息（CPU、内存、硬盘、GPU），编码为JSON并通过UDP发送给master节点
+# 功能：收集本机系统信息（CPU、内存、硬盘、GPU），编码为JSON或紧凑二进制格式(--wire bin)并通过UDP发送给master节点
 
 # ---------- 导入必要的系统库和第三方库 ----------
 import socket
@@ -11,6 +11,16 @@ import shutil
 import platform
 import re
 import json
+import struct
+import zlib
+import random
+import select
+import math
+import subprocess
+import threading
+import heapq
+
+from concurrent.futures import ThreadPoolExecutor, wait
 
 
 # ---------- 解析命令行参数：获取节点名称和master地址 ----------
@@ -18,6 +28,23 @@ def parse_args():
     parser = argparse.ArgumentParser(description="服务器监控从节点")
     parser.add_argument("--name", required=True, help="从节点名称")
     parser.add_argument("--master", required=True, help="主节点地址，格式为 IP:端口")
+    parser.add_argument("--wire", choices=["json", "bin"], default="json", help="上报格式: json 兼容旧版master, bin 为紧凑二进制格式(需新版master)")
+    parser.add_argument("--compress", action="store_true", help="bin 格式下使用 zlib 压缩")
+    parser.add_argument("--interval", type=float, default=120, help="上报间隔秒数(旧版master会丢弃100秒内的重复上报，新版master只丢弃上报时间相同的重复数据)")
+    parser.add_argument("--cpu_sample_interval", type=float, default=1, help="后台 CPU 采样间隔秒数，0 表示不启用后台采样(每核统计只在 --wire bin 下上报)")
+    parser.add_argument("--disk_min_gb", type=int, default=256, help="忽略小于该大小(GB)的挂载点")
+    parser.add_argument("--disk_timeout", type=float, default=2, help="单次采集中等待所有挂载点 statvfs 的超时秒数")
+    parser.add_argument("--top_users", type=int, default=5, help="上报占用资源最多的前 N 个用户，0 表示不统计")
+    parser.add_argument("--gpu_sampler", action="store_true", help="常驻一个 nvidia-smi -lms 进程持续采样GPU，而不是每次上报都启动 nvidia-smi")
+    parser.add_argument("--gpu_interval_ms", type=int, default=1000, help="持续采样模式下 nvidia-smi 的采样间隔毫秒数")
+    parser.add_argument("--nvidia_smi", default="nvidia-smi", help="nvidia-smi 可执行文件路径")
+    parser.add_argument("--delta", action="store_true", help="增量上报(隐含 --wire bin): 定期全量，其间只发送变化的部分或心跳，可配合更小的 --interval")
+    parser.add_argument("--full_interval", type=float, default=120, help="增量上报模式下发送全量快照的间隔秒数")
+    parser.add_argument(
+        "--collect_intervals", default="", help="各采集项的采集间隔秒数，格式: gpus=5,disks=300 (可选 ip/cpu/memory/disks/gpus/users，默认 ip=600 disks=300 users=300，其余与 --interval 相同；启用后台CPU采样时 cpu 每次上报读取一次)"
+    )
+    parser.add_argument("--collect_timeout", type=float, default=10, help="单次采集的超时秒数，超时后暂时上报默认值")
+    parser.add_argument("--mtu", type=int, default=1400, help="bin 格式下单个 UDP 数据报的最大字节数，超出则分片发送")
     return parser.parse_args()
 
 
@@ -56,26 +83,37 @@ def get_ip_address():
     return ip
 
 
-# ---------- 获取CPU温度 ----------
-def get_cpu_temp():
+# ---------- 将数值格式化为显示字符串，无效值显示为N/A ----------
+def fmt_num(value, spec="g"):
+    return "N/A" if value is None else format(value, spec)
+
+
+# ---------- 读取CPU温度(摄氏度)，无法获取时返回None ----------
+def read_cpu_temp():
     try:
         if not os.path.exists("/sys/class/thermal/thermal_zone0/temp"):
-            return "无法获取温度"
+            return None
         if platform.system() == "Linux":
             with open("/sys/class/thermal/thermal_zone0/temp") as f:
                 milli = int(f.read().strip())
-            temp = milli / 1000.0  # 摄氏度
-            color = get_color_by_percent(min(temp, 100))  # 把温度直接当百分比用
-            return f'温度 <span style="color:{color}">{temp:.1f}°C</span>'
+            return milli / 1000.0  # 摄氏度
         else:
-            return "无法获取温度"
+            return None
     except Exception as e:
         print(f"获取温度失败: {e}")
-        return "出错"
+        return None
 
 
-# ---------- 获取CPU使用率，通过读取/proc/stat文件计算（仅限Linux系统） ----------
-def get_cpu_usage():
+# ---------- 获取CPU温度 ----------
+def get_cpu_temp(temp):
+    if temp is None:
+        return "无法获取温度"
+    color = get_color_by_percent(min(temp, 100))  # 把温度直接当百分比用
+    return f'温度 <span style="color:{color}">{temp:.1f}°C</span>'
+
+
+# ---------- 读取CPU使用率(百分比)，通过读取/proc/stat文件计算（仅限Linux系统） ----------
+def read_cpu_usage():
     try:
         if platform.system() == "Linux":
             # 第一次读取CPU状态
@@ -89,19 +127,122 @@ def get_cpu_usage():
                 line = f.readline().split()
                 total2 = sum(int(x) for x in line[1:])
                 idle2 = int(line[4])
-            # 计算CPU使用率并添加颜色标记
-            usage = (1 - (idle2 - idle) / (total2 - total)) * 100
-            color = get_color_by_percent(usage)
-            return f'CPU <span style="color:{color}">{usage:.2f}%</span>'
+            # 计算CPU使用率
+            return round((1 - (idle2 - idle) / (total2 - total)) * 100, 2)
         else:
-            return "无法获取 CPU 使用率"
+            return None
     except Exception as e:
         print(f"获取 CPU 使用率失败: {e}")
-        return "出错"
+        return None
 
 
-# ---------- 获取内存信息，包括物理内存和Swap的使用情况及百分比 ----------
-def get_memory_info():
+# ---------- 计算一组采样值的 min/avg/max/p95 ----------
+def window_stats(values):
+    ordered = sorted(values)
+    p95 = ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+    return {"min": round(ordered[0], 2), "avg": round(sum(ordered) / len(ordered), 2), "max": round(ordered[-1], 2), "p95": round(p95, 2)}
+
+
+# ---------- 后台CPU采样器：按固定频率读取/proc/stat中所有cpu行，统计每个上报窗口内的总体与每核数据 ----------
+class CpuSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.file = open("/proc/stat", "r")  # 复用同一个文件句柄，每次采样前seek到开头
+        self.prev = self.read_times()
+        self.samples = {}  # "cpu"/"cpu0"/"cpu1"... -> 本窗口内的使用率采样列表
+        self.last = None  # 上一个完整窗口的统计，窗口为空时沿用
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # 至少完成一次采样后置位
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def read_times(self):
+        """返回 {cpu名: (总时间, 空闲时间)}，cpu行都在文件开头，遇到其他行即停止；需持有self.lock"""
+        self.file.seek(0)
+        times = {}
+        while True:
+            fields = self.file.readline().split()
+            if not fields or not fields[0].startswith("cpu"):
+                return times
+            times[fields[0]] = (sum(int(x) for x in fields[1:]), int(fields[4]))
+
+    def usage_since(self, times):
+        """返回 {cpu名: 距上次采样的使用率}，期间没有时钟滴答的cpu不计入"""
+        usage = {}
+        for key, (total, idle) in times.items():
+            prev = self.prev.get(key)
+            if prev is None or total <= prev[0]:
+                continue
+            usage[key] = min(max((1 - (idle - prev[1]) / (total - prev[0])) * 100, 0.0), 100.0)
+        return usage
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                try:
+                    times = self.read_times()
+                except Exception as e:
+                    print(f"采样 CPU 使用率失败: {e}")
+                    continue
+                for key, usage in self.usage_since(times).items():
+                    self.samples.setdefault(key, []).append(usage)
+                self.prev = times
+            self.ready.set()
+
+    def snapshot(self):
+        """取出并清空当前窗口，返回总体 min/avg/max/p95 及每核统计；不会阻塞等待采样"""
+        with self.lock:
+            samples, self.samples = self.samples, {}
+            if not samples.get("cpu"):
+                # 窗口为空(上报比采样更频繁)：沿用上一个窗口，尚无完整窗口时用距上次采样的瞬时差值
+                if self.last is not None:
+                    return dict(self.last)
+                try:
+                    samples = {key: [usage] for key, usage in self.usage_since(self.read_times()).items()}
+                except Exception:
+                    samples = {}
+        overall = samples.pop("cpu", None)
+        if not overall:
+            return None
+        stats = window_stats(overall)
+        cores = [window_stats(samples[key]) for key in sorted(samples, key=lambda k: int(k[3:]))]
+        self.last = {"percent": stats["avg"], "min": stats["min"], "max": stats["max"], "p95": stats["p95"], "cores": cores}
+        return dict(self.last)
+
+
+cpu_sampler = None  # Linux下在main中创建，--cpu_sample_interval 为0时不启用
+
+
+# ---------- 读取CPU使用率统计，启用采样器时直接取窗口统计，不阻塞上报 ----------
+def read_cpu_info():
+    if cpu_sampler is None:
+        cpu = {"percent": read_cpu_usage()}
+    else:
+        # 采样器刚启动、还没有任何时钟滴答时暂时没有数据，不退回到阻塞1秒的读取
+        cpu = cpu_sampler.snapshot() or {"percent": None}
+    cpu["temp"] = read_cpu_temp()
+    cpu["count"] = os.cpu_count()
+    return cpu
+
+
+# ---------- 获取CPU使用率的显示字符串 ----------
+def get_cpu_usage(cpu):
+    usage = cpu["percent"]
+    if usage is None:
+        return "无法获取 CPU 使用率"
+    color = get_color_by_percent(usage)
+    display = f'CPU <span style="color:{color}">{usage:.2f}%</span>'
+    # 有窗口统计时附加P95和峰值，区分短时突发与持续高负载
+    if "p95" in cpu:
+        display += f' (P95 {cpu["p95"]:.2f}% 最大 {cpu["max"]:.2f}%)'
+    return display
+
+
+# ---------- 读取内存信息(GB)，包括物理内存和Swap ----------
+def read_memory_info():
     try:
         if platform.system() == "Linux":
             # 读取内存信息文件，解析各项数据
@@ -111,175 +252,762 @@ def get_memory_info():
                 available_kb = int(re.search(r"MemAvailable:\s+(\d+)", lines[2]).group(1))
                 swap_total_kb = int(re.search(r"SwapTotal:\s+(\d+)", lines[14]).group(1))
                 swap_free_kb = int(re.search(r"SwapFree:\s+(\d+)", lines[15]).group(1))
-            # 转换为GB单位并计算使用率
+            # 转换为GB单位
             total = total_kb / 1024 / 1024
-            available = available_kb / 1024 / 1024
-            used = total - available
-            mem_percent = (used / total * 100) if total > 0 else 0
-            # 计算Swap使用情况
             swap_total = swap_total_kb / 1024 / 1024
-            swap_free = swap_free_kb / 1024 / 1024
-            swap_used = swap_total - swap_free
-            swap_percent = (swap_used / swap_total * 100) if swap_total > 0 else 0
-            # 生成带颜色的显示字符串
-            mem_color = get_color_by_percent(mem_percent)
-            swap_color = get_color_by_percent(swap_percent)
             return {
-                "memory_detail": {
-                    "total": round(total, 2),
-                    "used": round(used, 2),
-                    "percent": f"{mem_percent:.2f}%",
-                    "swap_total": round(swap_total, 2),
-                    "swap_used": round(swap_used, 2),
-                    "swap_percent": f"{swap_percent:.2f}%",
-                },
-                "display": f'内存 {used:.2f}GB/{total:.2f}GB=<span style="color:{mem_color}">{mem_percent:.2f}%</span><br>Swap {swap_used:.2f}GB/{swap_total:.2f}GB=<span style="color:{swap_color}">{swap_percent:.2f}%</span>',
+                "total": round(total, 2),
+                "used": round(total - available_kb / 1024 / 1024, 2),
+                "swap_total": round(swap_total, 2),
+                "swap_used": round(swap_total - swap_free_kb / 1024 / 1024, 2),
             }
         else:
-            return {"display": "无法获取"}
+            return None
     except Exception as e:
         print(f"获取内存信息失败: {e}")
-        return {"display": "出错"}
+        return None
+
+
+# ---------- 获取内存信息，包括物理内存和Swap的使用情况及百分比 ----------
+def get_memory_info(mem):
+    if not mem:
+        return {"display": "无法获取"}
+    total, used = mem["total"], mem["used"]
+    swap_total, swap_used = mem["swap_total"], mem["swap_used"]
+    mem_percent = (used / total * 100) if total > 0 else 0
+    swap_percent = (swap_used / swap_total * 100) if swap_total > 0 else 0
+    # 生成带颜色的显示字符串
+    mem_color = get_color_by_percent(mem_percent)
+    swap_color = get_color_by_percent(swap_percent)
+    return {
+        "memory_detail": {
+            "total": total,
+            "used": used,
+            "percent": f"{mem_percent:.2f}%",
+            "swap_total": swap_total,
+            "swap_used": swap_used,
+            "swap_percent": f"{swap_percent:.2f}%",
+        },
+        "display": f'内存 {used:.2f}GB/{total:.2f}GB=<span style="color:{mem_color}">{mem_percent:.2f}%</span><br>Swap {swap_used:.2f}GB/{swap_total:.2f}GB=<span style="color:{swap_color}">{swap_percent:.2f}%</span>',
+    }
+
+
+# ---------- 不属于真实存储的伪文件系统与内存文件系统类型 ----------
+PSEUDO_FS = {
+    "proc", "sysfs", "devtmpfs", "devpts", "tmpfs", "ramfs", "cgroup", "cgroup2", "pstore", "bpf", "tracefs", "debugfs",
+    "securityfs", "configfs", "fusectl", "mqueue", "hugetlbfs", "autofs", "binfmt_misc", "rpc_pipefs", "nsfs", "overlay",
+    "squashfs", "efivarfs", "selinuxfs", "fuse.gvfsd-fuse", "fuse.portal", "fuse.lxcfs",
+}
+
+
+# ---------- 还原mountinfo中转义的路径字符(如 \040 表示空格) ----------
+def unescape_mount(path):
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), path)
 
 
-# ---------- 获取根目录的硬盘使用情况信息 ----------
-def get_disk_info():
+# ---------- 硬盘采集器：解析/proc/self/mountinfo并缓存挂载点列表，statvfs在工作线程中带超时执行 ----------
+class DiskCollector:
+    def __init__(self, min_gb=256, timeout=2):
+        self.min_gb = min_gb  # 忽略小于该大小(GB)的挂载点
+        self.timeout = timeout  # 单次采集中所有statvfs的总等待秒数
+        self.mountinfo = None  # 上次读取的mountinfo原始内容，变化时才重建挂载点列表
+        self.mounts = []  # 过滤去重后的挂载点
+        self.small = set()  # 已确认小于min_gb的挂载点，挂载表变化前不再statvfs
+        self.stuck = {}  # 挂载点 -> 尚未返回的statvfs任务(如失效的NFS)，完成前不重复提交
+        self.pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="statvfs")
+
+    def refresh(self):
+        with open("/proc/self/mountinfo", "rb") as f:
+            content = f.read()
+        if content == self.mountinfo:
+            return
+        # 按设备号去重(bind mount 等重复挂载只保留路径最短的一个)，跳过伪文件系统
+        by_device = {}
+        for line in content.decode("utf-8", "replace").splitlines():
+            fields = line.split()
+            try:
+                sep = fields.index("-")
+                device, mount, fstype = fields[2], unescape_mount(fields[4]), fields[sep + 1]
+            except (ValueError, IndexError):
+                continue
+            if fstype in PSEUDO_FS:
+                continue
+            if device not in by_device or len(mount) < len(by_device[device]):
+                by_device[device] = mount
+        self.mountinfo = content
+        self.mounts = sorted(by_device.values())
+        self.small = set()
+
+    def read(self):
+        self.refresh()
+        # 上次超时的statvfs已返回则恢复采集
+        for mount in [m for m, future in self.stuck.items() if future.done()]:
+            del self.stuck[mount]
+        futures = {}
+        for mount in self.mounts:
+            if mount in self.small or mount in self.stuck:
+                continue
+            futures[mount] = self.pool.submit(os.statvfs, mount)
+        done, _ = wait(futures.values(), timeout=self.timeout)
+
+        disks = []
+        for mount, future in futures.items():
+            if future not in done:
+                print(f"挂载点 {mount} statvfs 超时，暂时跳过")
+                self.stuck[mount] = future
+                continue
+            try:
+                stat = future.result()
+            except OSError as e:
+                print(f"获取挂载点 {mount} 信息失败: {e}")
+                continue
+            total = (stat.f_blocks * stat.f_frsize) // (1024**3)
+            free = (stat.f_bfree * stat.f_frsize) // (1024**3)
+            if total < self.min_gb:
+                self.small.add(mount)
+                continue
+            disks.append({"mount": mount, "total": total, "used": total - free})
+        return disks
+
+
+disk_collector = DiskCollector()
+
+
+# ---------- 读取各挂载点的硬盘使用情况(GB) ----------
+def read_disk_info():
     try:
         if platform.system() == "Linux":
-            disk_detail = []
-            display_list = []
-            for line in os.popen("df -kP | awk 'NR>1 {print $6}' | sort -u").read().splitlines():
-                mount = line.strip()
-                stat = os.statvfs(mount)
-                total = (stat.f_blocks * stat.f_frsize) // (1024**3)
-                free = (stat.f_bfree * stat.f_frsize) // (1024**3)
-                used = total - free
-                if total < 256:
-                    continue  # 忽略小于256GB的挂载点
-                percent = (used / total * 100) if total > 0 else 0
-                color = get_color_by_percent(percent)
-                disk_detail.append(
-                    {
-                        "mount": mount,
-                        "total": total,
-                        "used": used,
-                        "percent": f"{percent:.2f}%",
-                    }
-                )
-                display_list.append(f'{mount} {used}GB/{total}GB=<span style="color:{color}">{percent:.2f}%</span>')
-            return {"disk_detail": disk_detail, "display": "<br>".join(display_list)} if disk_detail else {"display": "无硬盘"}
+            return disk_collector.read()
         else:
-            return {"display": "无法获取"}
+            return None
     except Exception as e:
         print(f"获取硬盘信息失败: {e}")
-        return {"display": "出错"}
+        return None
 
 
-# ---------- 获取GPU信息，需要nvidia-smi命令支持 ----------
-def get_gpu_info():
-    # 辅助函数：重新格式化GPU信息，提取数值部分
-    def reformat_gpu_info(util, mem_used, mem_total, fan, power):
-        import re
+# ---------- 获取硬盘使用情况的显示信息 ----------
+def get_disk_info(disks):
+    if disks is None:
+        return {"display": "无法获取"}
+    disk_detail = []
+    display_list = []
+    for disk in disks:
+        mount, total, used = disk["mount"], disk["total"], disk["used"]
+        percent = (used / total * 100) if total > 0 else 0
+        color = get_color_by_percent(percent)
+        disk_detail.append({"mount": mount, "total": total, "used": used, "percent": f"{percent:.2f}%"})
+        display_list.append(f'{mount} {used}GB/{total}GB=<span style="color:{color}">{percent:.2f}%</span>')
+    return {"disk_detail": disk_detail, "display": "<br>".join(display_list)} if disk_detail else {"display": "无硬盘"}
 
-        digits = re.compile(r"[.0-9]+")
 
-        def extract_first_match(text):
-            match = digits.findall(text)
-            return match[0] if match else "N/A"
+# ---------- GPU查询字段：带上index以便在持续输出中识别每一轮采样的边界 ----------
+GPU_QUERY = "index,utilization.gpu,memory.used,memory.total,fan.speed,power.draw"
+_re_num = re.compile(r"[.0-9]+")
 
-        # 从nvidia-smi输出中提取纯数字部分
-        util_val = extract_first_match(util)
-        mem_used_val = extract_first_match(mem_used)
-        mem_total_val = extract_first_match(mem_total)
-        fan_val = extract_first_match(fan)
-        power_val = extract_first_match(power)
-        return util_val, mem_used_val, mem_total_val, fan_val, power_val
 
-    try:
-        import subprocess
+# ---------- 解析nvidia-smi的一行csv输出(noheader,nounits)，无效值(如[N/A])解析为None ----------
+def parse_gpu_line(line):
+    fields = line.strip().split(", ")
+    if len(fields) != 6:
+        return None
+    values = []
+    for text in fields:
+        match = _re_num.search(text)
+        values.append(float(match.group(0)) if match else None)
+    if values[0] is None:
+        return None
+    return {"index": int(values[0]), "util": values[1], "mem_used": values[2], "mem_total": values[3], "fan": values[4], "power": values[5]}
+
+
+# ---------- 持久GPU采样器：常驻一个 nvidia-smi -lms 进程，在后台线程中增量解析输出 ----------
+class GpuSampler:
+    def __init__(self, command, interval_ms):
+        self.command = [command, f"--query-gpu={GPU_QUERY}", "--format=csv,noheader,nounits", "-lms", str(interval_ms)]
+        self.interval = interval_ms / 1000
+        self.latest = None  # 最近一轮完整采样的GPU列表(整体替换，读取无需加锁)
+        self.updated = 0.0  # 最近一轮采样完成的时间(monotonic)
+        self.indices = ()  # 完整一轮采样的GPU编号，用于及时判断本轮是否收齐
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                # slave退出后管道关闭，nvidia-smi会在下一次输出时因写入失败而退出
+                proc = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                frame = []
+                for line in proc.stdout:
+                    gpu = parse_gpu_line(line)
+                    if gpu is None:
+                        continue
+                    # index不大于上一行说明新一轮采样开始，先发布上一轮
+                    if frame and gpu["index"] <= frame[-1]["index"]:
+                        self.publish(frame)
+                        frame = []
+                    frame.append(gpu)
+                    # 本轮已收齐所有已知编号的GPU时立即发布，无需等待下一轮
+                    if tuple(g["index"] for g in frame) == self.indices:
+                        self.publish(frame)
+                        frame = []
+                proc.wait()
+                print(f"nvidia-smi 采样进程退出 (返回码 {proc.returncode})，{backoff} 秒后重启")
+            except Exception as e:
+                print(f"nvidia-smi 采样进程启动失败: {e}，{backoff} 秒后重启")
+            # 运行较长时间后退出则立即恢复正常的重启间隔，否则指数退避
+            backoff = 1 if time.monotonic() - started > 60 else min(backoff * 2, 60)
+            time.sleep(backoff)
 
-        if shutil.which("nvidia-smi") is None:
-            return {"display": "无GPU"}
+    def publish(self, frame):
+        # 某一行无法解析(如 "Unable to determine the device handle")时本轮会缺少部分GPU，不据此缩小已知编号，
+        # 否则之后每一轮都会在收到缺少的那部分之前提前发布；GPU真正减少时仍会在下一轮开始时发布
+        indices = tuple(gpu["index"] for gpu in frame)
+        if not set(indices) < set(self.indices):
+            self.indices = indices
+        self.latest = frame
+        self.updated = time.monotonic()
+
+    def read(self):
+        """返回最近一轮采样结果，进程异常导致数据过旧时返回None"""
+        if self.latest is None or time.monotonic() - self.updated > max(10, self.interval * 5):
+            return None
+        return [dict(gpu) for gpu in self.latest]
+
+
+gpu_sampler = None  # 启用 --gpu_sampler 时在main中创建
+nvidia_smi = "nvidia-smi"  # nvidia-smi 可执行文件路径，可通过 --nvidia_smi 指定(如用于测试的模拟脚本)
+
+
+# ---------- 读取GPU信息，需要nvidia-smi命令支持 ----------
+def read_gpu_info():
+    # 持久采样模式直接返回最新结果
+    if gpu_sampler is not None:
+        return gpu_sampler.read()
+    try:
+        if shutil.which(nvidia_smi) is None:
+            return []
 
         # 执行nvidia-smi命令获取GPU信息
         result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total,fan.speed,power.draw", "--format=csv"],
+            [nvidia_smi, f"--query-gpu={GPU_QUERY}", "--format=csv,noheader,nounits"],
             capture_output=True,
             text=True,
         )
-        # 解析输出，跳过标题行
-        lines = result.stdout.splitlines()[1:]
-        gpu_detail = []
-        display_list = []
-        # 处理每个GPU的信息
-        for i, line in enumerate(lines):
-            util, mem_used, mem_total, fan, power = line.split(", ")
-            util, mem_used, mem_total, fan, power = reformat_gpu_info(util, mem_used, mem_total, fan, power)
-            # 计算显存使用率
-            try:
-                mem_ratio = float(mem_used) / float(mem_total) * 100
-            except:
-                mem_ratio = 0
-            # 生成带颜色的显示信息
-            util_color = get_color_by_percent(util)
-            mem_color = get_color_by_percent(mem_ratio)
-            gpu_detail.append(
-                {
-                    "index": i,
-                    "util": f'<span style="color:{util_color}">{util}%</span>',
-                    "memory": f'<span style="color:{mem_color}">{mem_used}MB/{mem_total}MB={mem_ratio:.2f}%</span>',
-                    "fan": f"{fan}%",
-                    "power": f"{power}W",
-                }
-            )
-            display_list.append(
-                f'[GPU{i}]<br>使用 <span style="color:{util_color}">{util}%</span> 风扇 {fan}% 功率 {power}W<br>显存 <span style="color:{mem_color}">{mem_used}MB/{mem_total}MB={mem_ratio:.2f}%</span>'
-            )
-        return {"gpu_detail": gpu_detail, "display": "<br>".join(display_list)} if gpu_detail else {"display": "无GPU"}
+        return [gpu for gpu in map(parse_gpu_line, result.stdout.splitlines()) if gpu is not None]
     except Exception as e:
         print(f"获取 GPU 信息失败: {e}")
+        return None
+
+
+# ---------- 获取GPU信息的显示字符串 ----------
+def get_gpu_info(gpus):
+    if gpus is None:
         return {"display": "出错"}
+    gpu_detail = []
+    display_list = []
+    for gpu in gpus:
+        i = gpu["index"]
+        util, mem_used, mem_total = fmt_num(gpu["util"]), fmt_num(gpu["mem_used"]), fmt_num(gpu["mem_total"])
+        fan, power = fmt_num(gpu["fan"]), fmt_num(gpu["power"])
+        # 计算显存使用率
+        try:
+            mem_ratio = gpu["mem_used"] / gpu["mem_total"] * 100
+        except:
+            mem_ratio = 0
+        # 生成带颜色的显示信息
+        util_color = get_color_by_percent(gpu["util"])
+        mem_color = get_color_by_percent(mem_ratio)
+        gpu_detail.append(
+            {
+                "index": i,
+                "util": f'<span style="color:{util_color}">{util}%</span>',
+                "memory": f'<span style="color:{mem_color}">{mem_used}MB/{mem_total}MB={mem_ratio:.2f}%</span>',
+                "fan": f"{fan}%",
+                "power": f"{power}W",
+            }
+        )
+        display_list.append(
+            f'[GPU{i}]<br>使用 <span style="color:{util_color}">{util}%</span> 风扇 {fan}% 功率 {power}W<br>显存 <span style="color:{mem_color}">{mem_used}MB/{mem_total}MB={mem_ratio:.2f}%</span>'
+        )
+    return {"gpu_detail": gpu_detail, "display": "<br>".join(display_list)} if gpu_detail else {"display": "无GPU"}
+
+
+# ---------- 用户资源统计：增量扫描/proc/<pid>/stat，按Unix用户汇总CPU、内存和显存 ----------
+class ProcessScanner:
+    def __init__(self, top_n):
+        self.top_n = top_n
+        self.clk_tck = os.sysconf("SC_CLK_TCK")
+        self.page_gb = os.sysconf("SC_PAGE_SIZE") / 1024**3
+        with open("/proc/stat") as f:
+            self.boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        self.procs = {}  # pid -> (启动时间ticks, uid, 上次CPU时间ticks)，启动时间变化说明pid被复用
+        self.usernames = {}  # uid -> 用户名
+        self.last_scan = None  # 上次扫描的时间(monotonic)
+
+    def username(self, uid):
+        import pwd
+
+        if uid not in self.usernames:
+            try:
+                self.usernames[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                self.usernames[uid] = str(uid)
+        return self.usernames[uid]
+
+    def read_gpu_apps(self):
+        """返回 {pid: 显存MB}，没有nvidia-smi时返回空字典"""
+        if shutil.which(nvidia_smi) is None:
+            return {}
+        result = subprocess.run([nvidia_smi, "--query-compute-apps=pid,used_memory", "--format=csv,noheader,nounits"], capture_output=True, text=True, timeout=10)
+        apps = {}
+        for line in result.stdout.splitlines():
+            fields = line.split(", ")
+            if len(fields) == 2 and fields[0].strip().isdigit() and _re_num.match(fields[1].strip()):
+                pid = int(fields[0])
+                apps[pid] = apps.get(pid, 0) + float(fields[1])
+        return apps
+
+    def scan(self):
+        now = time.monotonic()
+        elapsed = now - self.last_scan if self.last_scan is not None else None
+        gpu_apps = self.read_gpu_apps()
+        users = {}  # uid -> 汇总数据
+        procs = {}
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            pid = int(entry.name)
+            try:
+                with open(f"/proc/{pid}/stat", "rb") as f:
+                    data = f.read()
+                # 进程名可能包含空格和括号，从最后一个')'之后开始解析
+                fields = data[data.rindex(b")") + 2 :].split()
+                cpu_ticks = int(fields[11]) + int(fields[12])
+                start_ticks = int(fields[19])
+                rss_pages = int(fields[21])
+                cached = self.procs.get(pid)
+                if cached is not None and cached[0] == start_ticks:
+                    uid, prev_ticks = cached[1], cached[2]
+                else:
+                    uid = entry.stat().st_uid
+                    # 上次扫描之后才启动的进程，全部CPU时间都属于本窗口
+                    started = self.boot_time + start_ticks / self.clk_tck
+                    prev_ticks = 0 if elapsed is not None and started >= time.time() - elapsed else cpu_ticks
+            except (OSError, ValueError, IndexError):
+                continue  # 进程已退出
+            procs[pid] = (start_ticks, uid, cpu_ticks)
+            user = users.setdefault(uid, {"ticks": 0, "rss": 0, "gpu_mem": 0.0, "procs": 0, "since": None})
+            user["ticks"] += cpu_ticks - prev_ticks
+            user["rss"] += rss_pages
+            user["procs"] += 1
+            gpu_mem = gpu_apps.get(pid, 0.0)
+            user["gpu_mem"] += gpu_mem
+            # 占用时间从该用户最早的活跃进程(本窗口有CPU时间或占用显存)启动时算起
+            if gpu_mem > 0 or cpu_ticks > prev_ticks:
+                started = int(self.boot_time + start_ticks / self.clk_tck)
+                user["since"] = started if user["since"] is None else min(user["since"], started)
+        self.procs = procs
+        self.last_scan = now
+
+        result = []
+        for uid, user in users.items():
+            cpu = user["ticks"] / self.clk_tck / elapsed if elapsed else 0.0
+            rss = user["rss"] * self.page_gb
+            if cpu < 0.05 and user["gpu_mem"] <= 0 and rss < 0.5:
+                continue  # 忽略几乎不占用资源的用户
+            result.append(
+                {"user": self.username(uid), "cpu": round(cpu, 2), "rss": round(rss, 2), "gpu_mem": round(user["gpu_mem"], 1), "procs": user["procs"], "since": user["since"]}
+            )
+        result.sort(key=lambda u: (u["gpu_mem"], u["cpu"], u["rss"]), reverse=True)
+        return result[: self.top_n]
+
+
+process_scanner = None  # --top_users 大于0且为Linux时在main中创建
+
+
+# ---------- 读取占用资源最多的用户列表，未启用时返回None ----------
+def read_user_info():
+    if process_scanner is None:
+        return None
+    try:
+        return process_scanner.scan()
+    except Exception as e:
+        print(f"获取用户资源占用失败: {e}")
+        return None
+
+
+# ---------- 采集器注册表：每个采集项有独立的采集间隔和超时，由一个调度线程按到期时间提交到工作线程执行 ----------
+# 上报时直接使用各采集项最近一次的结果，不等待采集；变化快且开销小的指标(CPU、GPU)可以几秒采集一次，硬盘、IP和需要扫描全部进程的用户统计几分钟一次
+class Collector:
+    def __init__(self, name, read, interval=None, fallback=None):
+        self.name = name
+        self.read = read
+        self.interval = interval  # 采集间隔秒数，None表示与上报间隔相同
+        self.on_report = False  # 不由调度线程采集，每次上报时同步读取(开销很小且结果与上报窗口绑定的项，如后台CPU采样的窗口统计)
+        self.fallback = fallback  # 采集超时时上报的值
+        self.value = fallback  # 最近一次的采集结果(整体替换，读取无需加锁)
+        self.duration = None  # 最近一次采集的耗时(秒)，随上报发送给master用于自监控
+        self.fresh = False  # 上次上报之后是否完成过采集，只上报新的耗时，避免master重复统计
+        self.future = None  # 正在执行的采集任务
+        self.started = 0.0  # 本次采集开始的时间(monotonic)
+        self.timed_out = False  # 本次采集已超时，结果返回前上报fallback
+        self.ready = threading.Event()  # 首次采集完成或超时后置位
+
+    def collect(self):
+        started = time.perf_counter()
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"采集 {self.name} 失败: {e}")
+            value = self.fallback
+        self.duration = time.perf_counter() - started
+        self.fresh = True
+        self.value = value
+        self.timed_out = False
+        self.ready.set()
+
+
+# 读取函数在各自的 read_* 中处理异常并返回None，ip 和 cpu 超时时上报的值与采集失败时相同
+collectors = [
+    Collector("ip", get_ip_address, 600, "unknown"),
+    Collector("cpu", read_cpu_info, fallback={"percent": None, "temp": None, "count": os.cpu_count()}),
+    Collector("memory", read_memory_info),
+    Collector("disks", read_disk_info, 300),
+    Collector("gpus", read_gpu_info),
+    Collector("users", read_user_info, 300),
+]
+
+
+class CollectorScheduler:
+    def __init__(self, collectors, default_interval, timeout):
+        self.collectors = collectors
+        self.default_interval = default_interval
+        self.timeout = timeout
+        # 每个采集项同时最多一个任务在执行，线程数等于采集项数即可，线程在两次采集之间阻塞不占用CPU
+        self.pool = ThreadPoolExecutor(max_workers=len(collectors), thread_name_prefix="collector")
+
+    def interval(self, collector):
+        return collector.interval if collector.interval is not None else self.default_interval
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def wait_ready(self):
+        """等待所有采集项完成首次采集(超时的采集项不再等待)"""
+        deadline = time.monotonic() + self.timeout + 1
+        for collector in self.collectors:
+            if not collector.on_report:
+                collector.ready.wait(max(0, deadline - time.monotonic()))
+
+    def run(self):
+        heap = [(time.monotonic(), i) for i, collector in enumerate(self.collectors) if not collector.on_report]
+        if not heap:
+            return
+        while True:
+            now = time.monotonic()
+            # 提交到期的采集任务，上一次仍未返回(如失效的NFS或卡住的nvidia-smi)时跳过本轮，不重复提交
+            while heap[0][0] <= now:
+                due, i = heapq.heappop(heap)
+                collector = self.collectors[i]
+                if collector.future is None or collector.future.done():
+                    collector.started = now
+                    collector.future = self.pool.submit(collector.collect)
+                # 已经落后时从当前时间重新对齐，不连续补采
+                due += self.interval(collector)
+                heapq.heappush(heap, (due if due > now else now + self.interval(collector), i))
+            # 检查超时：上报改用fallback值，任务返回后自动恢复
+            wake = heap[0][0]
+            for collector in self.collectors:
+                future = collector.future
+                if future is None or future.done() or collector.timed_out:
+                    continue
+                deadline = collector.started + self.timeout
+                if now >= deadline:
+                    print(f"采集 {collector.name} 超过 {self.timeout:g} 秒未返回，暂时上报默认值")
+                    collector.value = collector.fallback
+                    collector.timed_out = True
+                    collector.ready.set()
+                else:
+                    wake = min(wake, deadline)
+            time.sleep(max(0, wake - time.monotonic()))
+
+
+collector_scheduler = None  # 在main中创建
+
+
+# ---------- 组装本机所有数值指标：使用各采集项的缓存结果，未启动调度器(如被其他脚本导入)时同步采集一次 ----------
+def collect_metrics(name):
+    for collector in collectors:
+        if collector_scheduler is None or collector.on_report:
+            collector.collect()
+    metrics = {"name": name, "ts": int(time.time())}
+    for collector in collectors:
+        metrics[collector.name] = collector.value
+    # 上次上报之后完成的采集的耗时(秒)，随上报发送给master用于自监控
+    metrics["timings"] = {}
+    for collector in collectors:
+        if collector.fresh:
+            collector.fresh = False
+            metrics["timings"][collector.name] = collector.duration
+    return metrics
+
+
+# ---------- 由数值指标生成旧版JSON上报内容(带HTML显示字符串，兼容旧版master) ----------
+def build_json_info(metrics):
+    # 每核统计只通过 --wire bin 发送：核数多的机器会使JSON超过旧版master 16KB的接收上限
+    cpu = {key: value for key, value in metrics["cpu"].items() if key != "cores"}
+    return {
+        "name": {"display": metrics["name"]},
+        "ip": {"display": metrics["ip"]},
+        "cpu": {"display": "<br>".join([get_cpu_usage(metrics["cpu"]), get_cpu_temp(metrics["cpu"]["temp"])])},
+        "memory": get_memory_info(metrics["memory"]),
+        "disk": get_disk_info(metrics["disks"]),
+        "gpu": get_gpu_info(metrics["gpus"]),
+        "timestamp": {"display": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(metrics["ts"]))},
+        # 新版master优先使用该字段中的数值，无需解析显示字符串
+        "metrics": {**metrics, "cpu": cpu},
+    }
+
+
+# ---------- 紧凑二进制上报格式(版本1) ----------
+# 每个UDP数据报: 头部 "!4sBBIBB" = 魔数 FMLW, 格式版本, 标志位(bit0=zlib压缩), 消息ID, 分片序号, 分片总数
+# 所有分片的数据拼接(并按需解压)后为若干段: 段类型 u8 + 段长度 u16 + 段内容，master跳过不认识的段类型
+# 段内容只包含数值，浮点数使用 float32，NaN 表示无效值；字符串为 u16 长度 + UTF-8 字节
+WIRE_MAGIC = b"FMLW"
+WIRE_VERSION = 1
+WIRE_HEADER = struct.Struct("!4sBBIBB")
+WIRE_FLAG_ZLIB = 0x01
+SEC_IDENT, SEC_CPU, SEC_MEMORY, SEC_DISKS, SEC_GPUS, SEC_CPU_STATS, SEC_USERS, SEC_SEQ, SEC_TIMINGS = 1, 2, 3, 4, 5, 6, 7, 8, 9
+KIND_FULL, KIND_DELTA, KIND_HEARTBEAT = 0, 1, 2  # 序号段中的上报类型：全量、增量、心跳
+RESYNC_MAGIC = b"FMLR"  # master发现序号缺失时回复 FMLR + 会话ID(u32)，要求下一次发送全量
+
+
+def _pack_str(text):
+    data = text.encode("utf-8")[:0xFFFF]
+    return struct.pack("!H", len(data)) + data
+
+
+def _nan(value):
+    return float("nan") if value is None else value
+
+
+def encode_groups(metrics):
+    """将数值指标按分组编码为二进制段，返回 [(分组名, [(段类型, 段内容), ...]), ...]，值为None的分组整体省略"""
+    groups = []
+    cpu = metrics["cpu"]
+    sections = [(SEC_CPU, struct.pack("!ffH", _nan(cpu["percent"]), _nan(cpu["temp"]), cpu.get("count") or 0))]
+    if "p95" in cpu:
+        # 窗口统计：每核的百分比以0.01%为单位存为u16
+        body = struct.pack("!fffH", cpu["min"], cpu["max"], cpu["p95"], len(cpu["cores"]))
+        for core in cpu["cores"]:
+            body += struct.pack("!HHHH", *(round(core[k] * 100) for k in ("min", "avg", "max", "p95")))
+        sections.append((SEC_CPU_STATS, body))
+    groups.append(("cpu", sections))
+    mem = metrics["memory"]
+    if mem is not None:
+        groups.append(("memory", [(SEC_MEMORY, struct.pack("!ffff", mem["total"], mem["used"], mem["swap_total"], mem["swap_used"]))]))
+    if metrics["disks"] is not None:
+        body = struct.pack("!B", len(metrics["disks"][:255]))
+        for disk in metrics["disks"][:255]:
+            body += _pack_str(disk["mount"]) + struct.pack("!II", disk["total"], disk["used"])
+        groups.append(("disks", [(SEC_DISKS, body)]))
+    if metrics["gpus"] is not None:
+        body = struct.pack("!B", len(metrics["gpus"][:255]))
+        for gpu in metrics["gpus"][:255]:
+            body += struct.pack("!Bfffff", gpu["index"], *(_nan(gpu[k]) for k in ("util", "mem_used", "mem_total", "fan", "power")))
+        groups.append(("gpus", [(SEC_GPUS, body)]))
+    if metrics.get("users") is not None:
+        body = struct.pack("!B", len(metrics["users"][:255]))
+        for user in metrics["users"][:255]:
+            body += _pack_str(user["user"]) + struct.pack("!fffHI", user["cpu"], user["rss"], user["gpu_mem"], min(user["procs"], 0xFFFF), user["since"] or 0)
+        groups.append(("users", [(SEC_USERS, body)]))
+    return groups
+
+
+def encode_report(metrics, seq=None, only=None):
+    """
+    编码一次上报：标识段 + 可选的序号段 (会话ID, 序号, 类型) + 采集耗时段 + 各分组的段
+    only 不为None时只包含其中列出的分组(增量上报)，采集耗时段不参与增量比较，每次都发送
+    """
+    sections = [(SEC_IDENT, _pack_str(metrics["name"]) + _pack_str(metrics["ip"]) + struct.pack("!I", metrics["ts"]))]
+    if seq is not None:
+        sections.append((SEC_SEQ, struct.pack("!IIB", *seq)))
+    timings = metrics.get("timings")
+    if timings:
+        sections.append((SEC_TIMINGS, struct.pack("!B", len(timings)) + b"".join(_pack_str(key) + struct.pack("!f", value) for key, value in timings.items())))
+    for group, group_sections in encode_groups(metrics):
+        if only is None or group in only:
+            sections.extend(group_sections)
+    return b"".join(struct.pack("!BH", tag, len(body)) + body for tag, body in sections)
+
+
+def pack_datagrams(payload, compress, mtu):
+    """按需压缩后切分为多个带头部的UDP数据报"""
+    flags = 0
+    if compress:
+        packed = zlib.compress(payload, 6)
+        if len(packed) < len(payload):
+            payload, flags = packed, WIRE_FLAG_ZLIB
+    chunk = max(mtu - WIRE_HEADER.size, 64)
+    chunks = [payload[i : i + chunk] for i in range(0, len(payload), chunk)] or [b""]
+    if len(chunks) > 255:
+        raise ValueError(f"上报数据过大: {len(payload)} 字节")
+    msg_id = random.getrandbits(32)
+    return [WIRE_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, flags, msg_id, i, len(chunks)) + c for i, c in enumerate(chunks)]
+
+
+# ---------- 增量上报：各字段变化超过阈值才重新发送(单位与上报数值相同)，未列出的字段需完全相等 ----------
+DELTA_THRESHOLDS = {
+    "percent": 2, "temp": 2, "min": 5, "avg": 5, "max": 5, "p95": 5,  # CPU %、°C
+    "used": 0.5, "swap_used": 0.5,  # 内存 GB，硬盘 GB(整数，即变化1GB)
+    "util": 5, "mem_used": 256, "fan": 5, "power": 20,  # GPU %、MB、%、W
+    "cpu": 0.5, "rss": 1, "gpu_mem": 256, "procs": 5,  # 用户 核数、GB、MB、进程数
+}
+
+
+def changed(old, new, key=None):
+    """递归比较两次采集的数值，任一字段变化超过阈值时返回True"""
+    if isinstance(new, dict) and isinstance(old, dict):
+        return old.keys() != new.keys() or any(changed(old[k], new[k], k) for k in new)
+    if isinstance(new, list) and isinstance(old, list):
+        return len(old) != len(new) or any(changed(a, b, key) for a, b in zip(old, new))
+    if isinstance(new, (int, float)) and isinstance(old, (int, float)) and not isinstance(new, bool):
+        return abs(new - old) > DELTA_THRESHOLDS.get(key, 0)
+    return old != new
+
+
+class DeltaReporter:
+    """定期发送全量快照，其间只发送变化超过阈值的分组，没有变化时只发送心跳"""
+
+    def __init__(self, full_interval):
+        self.full_interval = full_interval
+        self.session = random.getrandbits(32)  # slave每次启动使用新的会话ID，master据此识别重启
+        self.seq = 0
+        self.sent = {}  # 分组名 -> master端当前持有的该分组数值
+        self.last_full = None
+        self.force_full = False  # 收到master的重同步请求后置位
+
+    def encode(self, metrics):
+        self.seq += 1
+        now = time.monotonic()
+        groups = [group for group, _ in encode_groups(metrics)]
+        if self.force_full or self.last_full is None or now - self.last_full >= self.full_interval:
+            self.sent = {group: metrics[group] for group in groups}
+            self.last_full = now
+            self.force_full = False
+            return encode_report(metrics, (self.session, self.seq, KIND_FULL))
+        delta = [group for group in groups if changed(self.sent.get(group), metrics[group])]
+        for group in delta:
+            self.sent[group] = metrics[group]
+        return encode_report(metrics, (self.session, self.seq, KIND_DELTA if delta else KIND_HEARTBEAT), delta)
+
+    def poll_resync(self, sock):
+        """非阻塞地检查master是否要求重同步"""
+        while select.select([sock], [], [], 0)[0]:
+            try:
+                data = sock.recv(64)
+            except OSError:
+                return  # 如master端口不可达时收到的ICMP错误
+            if data[:4] == RESYNC_MAGIC and data[4:8] == struct.pack("!I", self.session):
+                print("master 请求重同步，下一次发送全量数据")
+                self.force_full = True
 
 
 # ---------- 主程序入口：解析参数、收集系统信息、发送数据到master节点 ----------
 def main():
+    global gpu_sampler, nvidia_smi, cpu_sampler, process_scanner, collector_scheduler
     # 解析命令行参数获取节点名称和master地址
     args = parse_args()
     name = args.name
     master_host, master_port = args.master.split(":")
     master_port = int(master_port)
 
-    # 创建UDP套接字用于发送数据
+    disk_collector.min_gb = args.disk_min_gb
+    disk_collector.timeout = args.disk_timeout
+
+    # 按需启动持久GPU采样器，本机没有nvidia-smi时不启动
+    nvidia_smi = args.nvidia_smi
+    if args.gpu_sampler and shutil.which(nvidia_smi) is not None:
+        gpu_sampler = GpuSampler(nvidia_smi, args.gpu_interval_ms).start()
+
+    # Linux下启动后台CPU采样器，并等待第一次采样完成
+    if args.cpu_sample_interval > 0 and platform.system() == "Linux":
+        cpu_sampler = CpuSampler(args.cpu_sample_interval).start()
+        cpu_sampler.ready.wait(args.cpu_sample_interval * 5)
+
+    # 按需启动用户资源统计，首次扫描只建立基线
+    if args.top_users > 0 and platform.system() == "Linux":
+        process_scanner = ProcessScanner(args.top_users)
+        read_user_info()
+
+    # 按参数覆盖各采集项的采集间隔，启动调度线程并等待首次采集完成
+    by_name = {collector.name: collector for collector in collectors}
+    for item in filter(None, args.collect_intervals.split(",")):
+        key, _, value = item.partition("=")
+        if key.strip() not in by_name:
+            raise SystemExit(f"未知的采集项: {key}，可选: {', '.join(by_name)}")
+        try:
+            interval = float(value)
+        except ValueError:
+            interval = 0
+        if not interval > 0:
+            raise SystemExit(f"采集间隔必须为正数: {item}")
+        by_name[key.strip()].interval = interval
+    if args.interval <= 0:
+        raise SystemExit("--interval 必须为正数")
+    # 启用后台CPU采样时，每次上报统计的是两次上报之间的整个窗口，读取窗口会清空采样，因此只在上报时读取
+    if cpu_sampler is not None:
+        by_name["cpu"].on_report = True
+        if by_name["cpu"].interval is not None:
+            print("已启用后台CPU采样(--cpu_sample_interval)，CPU统计按上报窗口计算，忽略 cpu 的采集间隔")
+    collector_scheduler = CollectorScheduler(collectors, args.interval, args.collect_timeout).start()
+    collector_scheduler.wait_ready()
+
+    # 创建UDP套接字用于发送数据(增量模式下也用于接收master的重同步请求)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    reporter = DeltaReporter(args.full_interval) if args.delta else None
+    if reporter is not None:
+        args.wire = "bin"
 
-    # 主循环：持续收集和发送系统信息
+    # 主循环：按固定时间表上报，各项系统信息由调度线程在后台采集，组装上报内容不需要等待
+    next_report = time.monotonic()
     while True:
-        # 收集各项系统信息并组装成字典
-        info = {
-            "name": {"display": name},
-            "ip": {"display": get_ip_address()},
-            "cpu": {"display": "<br>".join([get_cpu_usage(), get_cpu_temp()])},
-            "memory": get_memory_info(),
-            "disk": get_disk_info(),
-            "gpu": get_gpu_info(),
-            "timestamp": {"display": time.strftime("%Y-%m-%d %H:%M:%S")},
-        }
-        # 将字典编码为JSON格式的UTF-8二进制数据
+        metrics = collect_metrics(name)
+        # 按上报格式编码为一个或多个UDP数据报
         try:
-            message = json.dumps(info, ensure_ascii=False).encode("utf-8")
+            if reporter is not None:
+                reporter.poll_resync(sock)
+                messages = pack_datagrams(reporter.encode(metrics), args.compress, args.mtu)
+            elif args.wire == "bin":
+                messages = pack_datagrams(encode_report(metrics), args.compress, args.mtu)
+            else:
+                messages = [json.dumps(build_json_info(metrics), ensure_ascii=False).encode("utf-8")]
+                if len(messages[0]) > 1024 * 16:
+                    print(f"警告: JSON 数据 {len(messages[0])} 字节超过旧版master的16KB接收上限，建议使用 --wire bin")
         except Exception as e:
-            print(f"JSON 编码失败: {e}")
-            continue
+            print(f"编码失败: {e}")
+            messages = []
 
         # 通过UDP发送数据到master节点
         try:
-            sock.sendto(message, (master_host, master_port))
-            print(f"已发送数据到 {master_host}:{master_port}")
+            for message in messages:
+                sock.sendto(message, (master_host, master_port))
+            if messages:
+                print(f"已发送数据到 {master_host}:{master_port}")
         except Exception as e:
             print(f"发送失败: {e}")
 
-        # 每120秒发送一次数据
-        time.sleep(120)
+        # 等待到下一个上报时间点，已经落后时从当前时间重新对齐
+        next_report += args.interval
+        delay = next_report - time.monotonic()
+        if delay < 0:
+            next_report = time.monotonic()
+            delay = 0
+        time.sleep(delay)
 
 
 if __name__ == "__main__":